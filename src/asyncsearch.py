@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+from src.chess import Chess
+from src.evaluation import evaluate_material
+from src.game import Game
+from src.state import State
+from src.strategy import iterative_deepening_search, principal_variation, pvs_search
+from src.transposition import TranspositionTable
+
+# Async search: the iterative deepening search runs in an executor (a thread
+# of the event loop by default) on a copy of the state, so the loop goes on
+# while it thinks. It is stopped with a threading.Event the search looks at
+# every STOP_INTERVAL nodes (see strategy.py), and then returns the best
+# action of the last iteration it finished. After every iteration the depth,
+# score, principal variation and nodes are put on a queue, read by iterating
+# over the search with async for.
+
+class Limits:
+
+    def __init__(self, time=None, depth=64) -> None:
+        self.time = time # seconds, None searches until stopped or depth
+        self.depth = depth
+
+    def __repr__(self) -> str:
+        return f"Limits(time={self.time}, depth={self.depth})"
+
+class AsyncSearch:
+    """Search state with pvs_search by iterative deepening within limits,
+    in executor (the default executor of the loop when None). Must be created
+    in a coroutine. Other options are passed on to iterative_deepening_search.
+
+        search = AsyncSearch(state, Limits(time=5))
+        async for info in search:
+            print(info["depth"], info["score"], info["pv"])
+        move = await search.result()
+    """
+
+    def __init__(self, state: State, limits: Limits = None, game: Game = None, eval_fn=evaluate_material, tt: TranspositionTable = None, executor=None, **options) -> None:
+        self.state = state.copy() # searched in another thread
+        self.limits = limits if limits is not None else Limits()
+        self.game = game if game is not None else Chess()
+        self.eval_fn = eval_fn
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.options = options
+        self.stats = {} # of the last iteration, see iterative_deepening_search
+        self.stop_event = threading.Event()
+        self.loop = asyncio.get_running_loop()
+        self.progress = asyncio.Queue()
+        self.finished = False # the end of the progress was read
+        self.start = time.monotonic()
+        self.future = self.loop.run_in_executor(executor, self.run)
+
+    def run(self):
+        # runs in the executor
+        def report(stats, action):
+            info = {
+                "depth": stats["depth"],
+                "score": stats["score"],
+                # iteration d searches d + 1 plies
+                "pv": principal_variation(self.state, self.tt, stats["depth"] + 1),
+                "nodes": stats["nodes"],
+                "time": time.monotonic() - self.start
+            }
+            self.loop.call_soon_threadsafe(self.progress.put_nowait, info)
+
+        try:
+            return iterative_deepening_search(
+                self.game,
+                self.state,
+                time_limit=self.limits.time,
+                max_depth=self.limits.depth,
+                eval_fn=self.eval_fn,
+                tt=self.tt,
+                stats=self.stats,
+                search=pvs_search,
+                report=report,
+                stop=self.stop_event,
+                **self.options
+            )
+        finally:
+            self.loop.call_soon_threadsafe(self.progress.put_nowait, None)
+
+    def stop(self):
+        """Stop the search, result() then returns the best action so far."""
+        self.stop_event.set()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    async def result(self):
+        """The action of the search (packed, see move.py), None without legal
+        moves. Cancelling the wait stops the search and returns the best
+        action so far instead of raising CancelledError."""
+        try:
+            return await asyncio.shield(self.future)
+        except asyncio.CancelledError:
+            self.stop()
+            # the state is only safe to reuse once the search unwound
+            return await asyncio.shield(self.future)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        if self.finished:
+            raise StopAsyncIteration
+        info = await self.progress.get()
+        if info is None:
+            self.finished = True
+            raise StopAsyncIteration
+        return info
+
+async def search_async(state: State, limits: Limits = None, **options):
+    """Await the action of AsyncSearch(state, limits, **options)."""
+    return await AsyncSearch(state, limits, **options).result()
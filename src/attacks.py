@@ -0,0 +1,86 @@
+from src.vector import UNIT_VECTORS, Vector
+
+# Attack tables of the pieces as bitboards (see bitboard.py), indexed by
+# square. They are built once at import, move generation only looks them up.
+
+KNIGHT_VECTORS = [
+    Vector(-2, 1), Vector(-2, -1), Vector(-1, 2), Vector(-1, -2),
+    Vector(2, 1), Vector(2, -1), Vector(1, 2), Vector(1, -2)
+]
+
+PAWN_CAPTURE_VECTORS = [
+    [Vector.up_left(), Vector.up_right()],      # white
+    [Vector.down_left(), Vector.down_right()]   # black
+]
+
+# directions are indexes in UNIT_VECTORS: up, down, left, right, up left, up right, down left, down right
+ORTHOGONAL_DIRECTIONS = [0, 1, 2, 3]
+DIAGONAL_DIRECTIONS = [4, 5, 6, 7]
+# directions going to higher square indexes, their nearest blocker is the lowest bit
+INCREASING_DIRECTIONS = [False, True, False, True, False, False, True, True]
+
+def step(index: int, vec: Vector) -> int:
+    """Square index reached from index along vec, -1 when it leaves the board."""
+    row = (index >> 3) + vec.rowax
+    col = (index & 7) + vec.colax
+    if 0 <= row < 8 and 0 <= col < 8:
+        return row * 8 + col
+    return -1
+
+def leaper_attacks(index: int, vectors: list[Vector]) -> int:
+    bb = 0
+    for vec in vectors:
+        target = step(index, vec)
+        if target >= 0:
+            bb |= 1 << target
+    return bb
+
+def walk(index: int, vec: Vector) -> list[int]:
+    """Squares from index (excluded) to the edge of the board along vec."""
+    squares = []
+    target = step(index, vec)
+    while target >= 0:
+        squares.append(target)
+        target = step(target, vec)
+    return squares
+
+KNIGHT_ATTACKS = [leaper_attacks(index, KNIGHT_VECTORS) for index in range(64)]
+KING_ATTACKS = [leaper_attacks(index, UNIT_VECTORS) for index in range(64)]
+PAWN_ATTACKS = [
+    [leaper_attacks(index, vectors) for index in range(64)]
+    for vectors in PAWN_CAPTURE_VECTORS
+]
+
+# RAYS[direction][index]: squares from index to the edge, nearest first
+RAYS = [[walk(index, vec) for index in range(64)] for vec in UNIT_VECTORS]
+RAY_MASKS = [
+    [sum(1 << target for target in ray) for ray in rays]
+    for rays in RAYS
+]
+
+def build_between(a: int) -> list[int]:
+    between = [0 for _ in range(64)]
+    for rays in RAYS:
+        bb = 0
+        for target in rays[a]:
+            between[target] = bb
+            bb |= 1 << target
+    return between
+
+# BETWEEN[a][b]: squares strictly between a and b on a rank, file or diagonal, 0 when not aligned
+BETWEEN = [build_between(a) for a in range(64)]
+
+def slider_attacks(index: int, directions: list[int], occupied: int) -> int:
+    # each ray is cut after its nearest blocker
+    bb = 0
+    for direction in directions:
+        attacks = RAY_MASKS[direction][index]
+        blockers = attacks & occupied
+        if blockers:
+            if INCREASING_DIRECTIONS[direction]:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            attacks ^= RAY_MASKS[direction][blocker]
+        bb |= attacks
+    return bb
@@ -0,0 +1,54 @@
+import argparse
+import time
+from src.chess import Chess
+from src.evaluation import evaluate_material
+from src.perft import SUITE
+from src.strategy import alpha_beta_cutoff_search, iterative_deepening_search, pvs_search
+
+# Search benchmark: nodes and time of a fixed depth search on the perft
+# positions, once per configuration, to measure what a search change gains.
+# Every configuration searches with a fresh transposition table. With
+# iterative the depth is reached by iterative deepening (the time to depth).
+
+CONFIGS = {
+    "unordered": dict(order_moves=False, quiescence=False),
+    "ordered": dict(order_moves=True, quiescence=False),
+    "quiescence": dict(order_moves=True, quiescence=True),
+    "pvs": dict(search=pvs_search, order_moves=True, quiescence=True, null_move=0, late_move=0, pruning=False),
+    "reductions": dict(search=pvs_search, order_moves=True, quiescence=True, pruning=False),
+    "pruning": dict(search=pvs_search, order_moves=True, quiescence=True)
+}
+
+def bench(depth: int, configs: list[str], iterative=False):
+    totals = {name: [0, 0.0] for name in configs}
+    for position, fen, _ in SUITE:
+        line = [f"{position:<12}"]
+        for name in configs:
+            game = Chess(fen)
+            stats = {}
+            options = dict(CONFIGS[name])
+            search = options.pop("search", alpha_beta_cutoff_search)
+            start = time.perf_counter()
+            if iterative:
+                iterative_deepening_search(game, game.initial, max_depth=depth, eval_fn=evaluate_material, stats=stats, search=search, **options)
+            else:
+                search(game, game.initial, depth, eval_fn=evaluate_material, stats=stats, **options)
+            elapsed = time.perf_counter() - start
+            totals[name][0] += stats["nodes"]
+            totals[name][1] += elapsed
+            line.append(f"{name} {stats['nodes']:>8} nodes {elapsed:6.2f}s score {stats['score']:>4}")
+        print(" | ".join(line))
+    print(" | ".join([f"{'total':<12}"] + [
+        f"{name} {nodes:>8} nodes {elapsed:6.2f}s" for name, (nodes, elapsed) in totals.items()
+    ]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed depth search node counts on the perft positions.")
+    parser.add_argument("depth", type=int, nargs="?", default=2, help="d of alpha_beta_cutoff_search")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--iterative", action="store_true", help="deepen up to depth with iterative deepening")
+    args = parser.parse_args()
+    bench(args.depth, args.configs, args.iterative)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+from src.piece import PIECE_COLORS, PIECE_TYPES, Piece
+
+# A bitboard is a 64-bit int with one bit per square.
+# Bit i is the square of Cell(i // 8, i % 8): a8 = 0, h8 = 7, ..., a1 = 56, h1 = 63.
+
+FULL = (1 << 64) - 1
+ROWS = [0xFF << (8 * row) for row in range(8)] # ROWS[0] is rank 8
+
+# bitboard index of every (non-empty) piece, see piece_index()
+PIECES = [
+    Piece(piece_type, piece_color)
+    for piece_color in PIECE_COLORS
+    for piece_type in PIECE_TYPES
+]
+
+# offsets of the piece types in the six bitboards of a color: a color's queens
+# are bitboards[6 * color.value + QUEENS]
+PAWNS, KNIGHTS, BISHOPS, ROOKS, QUEENS, KINGS = range(len(PIECE_TYPES))
+
+def piece_index(piece: Piece) -> int:
+    return piece.code - 1
+
+def popcount(bb: int) -> int:
+    return bb.bit_count()
+
+def lsb(bb: int) -> int:
+    """Index of the least significant set bit, -1 for an empty bitboard."""
+    return (bb & -bb).bit_length() - 1
+
+def squares(bb: int):
+    """Iterate over the indexes of the set bits, lowest first."""
+    while bb:
+        bit = bb & -bb
+        yield bit.bit_length() - 1
+        bb ^= bit
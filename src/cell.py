@@ -1,35 +1,52 @@
 from src.vector import Vector
 
 class Cell:
-    
-    def __init__(self, row: int, col: int) -> None:
-        self.row = row
-        self.col = col
-            
+    # Cells are immutable and the 64 board cells are interned: Cell(row, col)
+    # returns the same object every time. Cells outside of the board (from
+    # translate()) are created on demand, their index is -1.
+    __slots__ = ("row", "col", "index")
+
+    def __new__(cls, row: int, col: int):
+        if 0 <= row < 8 and 0 <= col < 8:
+            return CELLS[row * 8 + col]
+        return Cell.create(row, col, -1)
+
+    @staticmethod
+    def create(row: int, col: int, index: int):
+        cell = object.__new__(Cell)
+        object.__setattr__(cell, "row", row)
+        object.__setattr__(cell, "col", col)
+        object.__setattr__(cell, "index", index) # bitboard square index
+        return cell
+
+    @staticmethod
+    def fromIndex(index: int):
+        return CELLS[index]
+
     def translate(self, vec: Vector):
         return Cell(self.row + vec.rowax, self.col + vec.colax)
-    
+
     def toLeft(self, distance: int = 1):
         return self.translate(Vector.left(distance))
-    
+
     def toRight(self, distance: int = 1):
         return self.translate(Vector.right(distance))
-    
+
     def toUp(self, distance: int = 1):
         return self.translate(Vector.up(distance))
-    
+
     def toDown(self, distance: int = 1):
         return self.translate(Vector.down(distance))
-    
+
     def toDownLeft(self, distance: int = 1):
         return self.translate(Vector.down_left(distance))
-    
+
     def toDownRight(self, distance: int = 1):
         return self.translate(Vector.down_right(distance))
 
     def toUpLeft(self, distance: int = 1):
         return self.translate(Vector.up_left(distance))
-    
+
     def toUpRight(self, distance: int = 1):
         return self.translate(Vector.up_right(distance))
 
@@ -37,10 +54,25 @@ class Cell:
         fen1 = str(8 - self.row)
         fen2 = chr(ord("a") + self.col)
         return fen2 + fen1
-    
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Cell is immutable")
+
+    def __reduce__(self):
+        return (Cell, (self.row, self.col))
+
     def __eq__(self, value: object) -> bool:
-        return self.row == value.row and self.col == value.col
-    
+        return self is value or (
+            isinstance(value, Cell) and self.row == value.row and self.col == value.col
+        )
+
+    def __hash__(self) -> int:
+        return self.index if self.index >= 0 else hash((self.row, self.col))
+
     def __str__(self) -> str:
         return self.getFEN()
-        
\ No newline at end of file
+
+    def __repr__(self) -> str:
+        return self.getFEN()
+
+CELLS = [Cell.create(index >> 3, index & 7, index) for index in range(64)]
@@ -13,7 +13,8 @@ class Chess(Game):
         self.initial = State(fen)
 
     def actions(self, state: State):
-        return state.possible_moves()
+        # packed moves, see move.py
+        return state.possible_moves(packed=True)
     
     def result(self, state: State, move: Move):
         return state.move(move)
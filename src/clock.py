@@ -0,0 +1,44 @@
+import time
+
+class Clock:
+    """Time control of one player for a whole game: seconds for the game (or
+    for each period of moves_to_go moves), plus increment seconds per move."""
+
+    # moves a game is assumed to last from here on in sudden death
+    EXPECTED_MOVES = 30
+    # kept in reserve for the overhead around the search
+    MARGIN = 0.05
+
+    def __init__(self, seconds: float, increment: float = 0, moves_to_go: int = None) -> None:
+        self.period = moves_to_go
+        self.period_time = seconds
+        self.remaining = seconds
+        self.increment = increment
+        self.moves_to_go = moves_to_go
+        self.started = None
+
+    def time_for_move(self) -> float:
+        """Seconds to spend on the next move."""
+        moves = self.moves_to_go or Clock.EXPECTED_MOVES
+        budget = self.remaining / moves + self.increment
+        return max(0.0, min(budget, self.remaining - Clock.MARGIN))
+
+    def start(self) -> float:
+        """Start thinking, returns the deadline (time.monotonic()) for the move."""
+        self.started = time.monotonic()
+        return self.started + self.time_for_move()
+
+    def stop(self):
+        """Stop thinking: the time spent is taken from the clock."""
+        self.remaining -= time.monotonic() - self.started
+        self.remaining += self.increment
+        self.started = None
+        if self.moves_to_go is not None:
+            self.moves_to_go -= 1
+            if self.moves_to_go == 0:
+                # next period
+                self.moves_to_go = self.period
+                self.remaining += self.period_time
+
+    def __repr__(self) -> str:
+        return f"<Clock {self.remaining:.1f}s left>"
@@ -0,0 +1,24 @@
+class History:
+    # One node per move played, linked to the node of the previous move.
+    # Nodes are never modified, so a copied state shares the history it has in
+    # common with the original: copying is O(1) whatever the game length.
+    #
+    # undo:   undo record of the move (it holds the move and the key of the
+    #         position before it), see State.unmake_move()
+    # check:  whether the move gave check, None for a move made without update
+    __slots__ = ("undo", "check", "parent")
+
+    def __init__(self, undo: tuple, check: bool, parent) -> None:
+        self.undo = undo
+        self.check = check
+        self.parent = parent
+
+    def nodes(self):
+        """Nodes from the first move to this one."""
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
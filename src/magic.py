@@ -0,0 +1,126 @@
+import random
+from src.attacks import DIAGONAL_DIRECTIONS, ORTHOGONAL_DIRECTIONS, RAYS, slider_attacks
+from src.bitboard import FULL
+
+# Magic bitboards: the attacks of a slider on a square only depend on the
+# blockers inside its relevant mask (its rays without the board edge). For
+# each square a magic number maps every subset of the mask to a distinct
+# table slot: ((occupied & mask) * magic mod 2^64) >> (64 - bits).
+#
+# The magic numbers below come from find_magics() (fixed seed, so running
+# `python -m src.magic` prints the same numbers again). The attack tables
+# are filled from them once at import.
+
+def relevant_mask(index: int, directions: list[int]) -> int:
+    mask = 0
+    for direction in directions:
+        for target in RAYS[direction][index][:-1]:
+            mask |= 1 << target
+    return mask
+
+def subsets(mask: int):
+    """All subsets of the bits of mask (carry-rippler), starting with 0."""
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if subset == 0:
+            break
+
+def fill_table(index: int, directions: list[int], mask: int, magic: int):
+    """Attack table of a square, None if magic maps two different attack sets to one slot."""
+    shift = 64 - mask.bit_count()
+    table = [None] * (1 << mask.bit_count())
+    for occupied in subsets(mask):
+        attacks = slider_attacks(index, directions, occupied)
+        slot = ((occupied * magic) & FULL) >> shift
+        if table[slot] is None:
+            table[slot] = attacks
+        elif table[slot] != attacks:
+            return None
+    return table
+
+def find_magics(directions: list[int], seed: int = 0) -> list[int]:
+    rng = random.Random(seed)
+    magics = []
+    for index in range(64):
+        mask = relevant_mask(index, directions)
+        while True:
+            # sparse candidates work best
+            magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+            if (((mask * magic) & FULL) >> 56).bit_count() < 6:
+                continue
+            if fill_table(index, directions, mask, magic) is not None:
+                break
+        magics.append(magic)
+    return magics
+
+BISHOP_MAGICS = [
+    0x00404800b10a0221, 0x0410040904103000, 0x000401020a000000, 0x2c82408100048100,
+    0x40108820680c8400, 0x4004c41040418100, 0x1080482808881000, 0x010c240602102200,
+    0x0080c0a202840112, 0x0221900400b40248, 0x0002041454004004, 0x0800040420840000,
+    0x0000040420200210, 0x5400020150088400, 0x8082408208200400, 0x0048002401041000,
+    0x40100009202810c8, 0x220800d081010c12, 0x01810108060c0210, 0x000400204100200a,
+    0x6011021820080000, 0x0192010088012800, 0x100200c402024240, 0x2000200080880814,
+    0x8008200904041080, 0x0202205402484208, 0x0208080484002022, 0x0204080004010410,
+    0x8200840002802010, 0x0020420004411014, 0x0008008001045100, 0x02804080c2108400,
+    0x0888200b00101200, 0x0000901000385290, 0x0010a10500700408, 0x0404020082080080,
+    0x0104044200040108, 0x4102205102020080, 0x0002881100204c00, 0x0149010202010070,
+    0x04070892400010c3, 0x1280820190522000, 0x4112020022006405, 0x2000244208040480,
+    0x0000080100400400, 0x0110200800421420, 0x0302028801020200, 0x0008310400224086,
+    0x011104014440d211, 0x0020220110080140, 0x00000a0072080200, 0x208054020504100c,
+    0x0000081082020000, 0x0080414408108008, 0x0031441050820d00, 0x020202040c008400,
+    0xa803040084111808, 0x0200008c00880400, 0x8000000202110403, 0x0200820a00840400,
+    0x0000000010020208, 0x00800088b0210a0d, 0x0000c00404988600, 0x0008200080811100
+]
+
+ROOK_MAGICS = [
+    0x0480002250844000, 0x8140001000200040, 0x0880081000812000, 0x0100082010010004,
+    0x0080040008008003, 0x0300110002080400, 0x1080008022000100, 0x0200040442220181,
+    0x0613002100800048, 0x0880401000402004, 0x2400808020001000, 0x00010010000c2100,
+    0x9004808044000800, 0x000a004200080410, 0x4014001004410208, 0x4003000100084082,
+    0x08c0208000804010, 0x0082838040002000, 0x0a01090020004010, 0x1023010022081001,
+    0x2004008008008004, 0x0004004002004100, 0x1000040002015098, 0x0830020001004084,
+    0x4140800080204003, 0x2401002100400080, 0x0010080020002400, 0x0001210a00120040,
+    0x9000480280040080, 0x0400020080800400, 0x20005504000e0890, 0xa009000900114086,
+    0x2080002000404000, 0x0020002080804004, 0x2840801000802004, 0x0241042009001000,
+    0x020e000492002048, 0x0408800400800200, 0x2001008419000a00, 0x0000188402000841,
+    0x0180010040810020, 0x8200201000404000, 0xd010080024002000, 0xc011023000630008,
+    0x0040080004008080, 0x0800040002008080, 0x0c0008390a840010, 0x00b4040050820021,
+    0x4140208000400080, 0xa8400020005000c0, 0x0a41200080100180, 0x8080480110008180,
+    0x0044040280080080, 0x4000040080020080, 0x0000d10a30080400, 0x0004010854008200,
+    0x0800120821004082, 0xa000120840208302, 0x00a0081420010041, 0x0000201000050009,
+    0xa02e001420b10812, 0x6202002450214802, 0x2240104209088824, 0x2000840093044022
+]
+
+class Magic:
+
+    def __init__(self, directions: list[int], magics: list[int]) -> None:
+        self.masks = [relevant_mask(index, directions) for index in range(64)]
+        self.magics = magics
+        self.shifts = [64 - mask.bit_count() for mask in self.masks]
+        self.tables = [
+            fill_table(index, directions, self.masks[index], magics[index])
+            for index in range(64)
+        ]
+
+    def attacks(self, index: int, occupied: int) -> int:
+        return self.tables[index][
+            ((occupied & self.masks[index]) * self.magics[index] & FULL) >> self.shifts[index]
+        ]
+
+BISHOP = Magic(DIAGONAL_DIRECTIONS, BISHOP_MAGICS)
+ROOK = Magic(ORTHOGONAL_DIRECTIONS, ROOK_MAGICS)
+
+def bishop_attacks(index: int, occupied: int) -> int:
+    return BISHOP.attacks(index, occupied)
+
+def rook_attacks(index: int, occupied: int) -> int:
+    return ROOK.attacks(index, occupied)
+
+def queen_attacks(index: int, occupied: int) -> int:
+    return BISHOP.attacks(index, occupied) | ROOK.attacks(index, occupied)
+
+if __name__ == "__main__":
+    print("BISHOP_MAGICS =", [hex(magic) for magic in find_magics(DIAGONAL_DIRECTIONS)])
+    print("ROOK_MAGICS =", [hex(magic) for magic in find_magics(ORTHOGONAL_DIRECTIONS)])
@@ -1,12 +1,24 @@
-from src.cell import Cell
+from src.cell import CELLS, Cell
 from src.piece import Piece, PieceType
 
+# A move packs into 16 bits: from square | to square << 6 | promotion << 12
+# (square indexes as in bitboard.py, promotion is a PieceType value). Move
+# generation and search work on these codes, Move objects are for the API.
+
 class Move:
+    # Moves are values: they compare and hash by their code and are never
+    # modified once created.
+    __slots__ = ("fromCell", "toCell", "promotion", "code")
     
     def __init__(self, fromCell: Cell, toCell: Cell, promotion: PieceType = PieceType.NONE) -> None:
         self.fromCell = fromCell
         self.toCell = toCell
         self.promotion = promotion
+        self.code = fromCell.index | toCell.index << 6 | promotion.value << 12
+        
+    @staticmethod
+    def fromCode(code: int):
+        return Move(CELLS[code & 63], CELLS[code >> 6 & 63], PieceType(code >> 12))
         
     def is_promotion(self):
         return self.promotion != PieceType.NONE
@@ -21,11 +33,10 @@ class Move:
         return fen_from + fen_to
     
     def __eq__(self, value: object) -> bool:
-        return (
-            self.fromCell == value.fromCell and
-            self.toCell == value.toCell and 
-            self.promotion == value.promotion
-        )
+        return isinstance(value, Move) and self.code == value.code
+    
+    def __hash__(self) -> int:
+        return self.code
     
     def __repr__(self) -> str:
         return self.getFEN()
\ No newline at end of file
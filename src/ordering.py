@@ -0,0 +1,131 @@
+from src.evaluation import evaluate_piece_type
+from src.piece import PIECE_TYPES, PieceType
+from src.state import State
+
+# Move ordering for the search: alpha-beta prunes the most when the best move
+# is searched first. Moves are packed codes (see move.py) and are sorted by:
+#
+#   1. the best move stored in the transposition table
+#   2. captures by MVV-LVA (most valuable victim, then least valuable
+#      attacker) and promotions
+#   3. killer moves: quiet moves that caused a cutoff at the same ply
+#   4. the countermove: the quiet move that refuted the previous move
+#   5. other quiet moves by history: how often they caused a cutoff, and
+#      captures losing material (State.see) among them
+
+# piece values by PieceType value
+VALUES = [0] + [evaluate_piece_type(piece_type) for piece_type in PIECE_TYPES]
+
+TT_MOVE = 1 << 30
+CAPTURE = 1 << 24
+KILLER = 1 << 22
+COUNTERMOVE = 1 << 21
+HISTORY_MAX = 1 << 20 # history scores are halved past it
+
+def capture_gain(state: State, move: int) -> int:
+    # material won by a capture or a promotion, before any recapture
+    board = state.board
+    toIndex = move >> 6 & 63
+    fromIndex = move & 63
+    attacker = board[fromIndex >> 3][fromIndex & 7].type
+    victim = board[toIndex >> 3][toIndex & 7].type
+    gain = VALUES[victim.value]
+    if attacker == PieceType.PAWN:
+        if victim == PieceType.NONE and (fromIndex - toIndex) & 7:
+            gain = VALUES[PieceType.PAWN.value] # en passant
+        if toIndex >> 3 in (0, 7):
+            gain += VALUES[PieceType.QUEEN.value] - VALUES[PieceType.PAWN.value]
+    return gain
+
+def losing_capture(state: State, move: int) -> bool:
+    # a capture (or promotion) losing material once the exchange on its square
+    # is over, see State.see. Taking a piece at least as valuable never loses.
+    board = state.board
+    toIndex = move >> 6 & 63
+    fromIndex = move & 63
+    attacker = board[fromIndex >> 3][fromIndex & 7].type
+    victim = board[toIndex >> 3][toIndex & 7].type
+    return VALUES[attacker.value] > VALUES[victim.value] and state.see(move) < 0
+
+class MoveOrdering:
+
+    def __init__(self) -> None:
+        self.killers = [] # per ply, two moves
+        self.history = [[0] * 4096 for _ in range(2)] # per color, by from | to << 6
+        self.countermoves = [0] * 4096 # by previous move from | to << 6
+
+    def new_search(self):
+        # killers are for the positions of one search, history fades out
+        self.killers = []
+        for table in self.history:
+            for i, score in enumerate(table):
+                if score:
+                    table[i] = score >> 1
+
+    def capture_score(self, state: State, move: int, see=False) -> int:
+        # 0 for a quiet move. With see a capture by a bigger piece that loses
+        # material (State.see) goes after the killers.
+        board = state.board
+        toIndex = move >> 6 & 63
+        fromIndex = move & 63
+        attacker = board[fromIndex >> 3][fromIndex & 7].type
+        victim = board[toIndex >> 3][toIndex & 7].type
+        if victim == PieceType.NONE:
+            if attacker == PieceType.PAWN and (fromIndex - toIndex) & 7:
+                victim = PieceType.PAWN # en passant
+            elif attacker == PieceType.PAWN and toIndex >> 3 in (0, 7):
+                return CAPTURE + VALUES[PieceType.QUEEN.value] * 16 # promotion
+            else:
+                return 0
+        score = CAPTURE + VALUES[victim.value] * 16 - VALUES[attacker.value]
+        if see and losing_capture(state, move):
+            score -= CAPTURE
+        return score
+
+    def is_quiet(self, state: State, move: int) -> bool:
+        return move >> 12 == 0 and self.capture_score(state, move) == 0
+
+    def countermove_of(self, state: State) -> int:
+        if state.history is None: return 0
+        return self.countermoves[state.history.undo[0] & 0xFFF]
+
+    def order(self, state: State, moves, tt_move: int = None, ply: int = 0, see=True) -> list[int]:
+        # see=False when the losing captures were already taken out
+        if state.promo:
+            return moves # promotion choices, already queen first
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        countermove = self.countermove_of(state)
+        history = self.history[state.to_move.value]
+        scored = []
+        for move in moves:
+            if move == tt_move:
+                score = TT_MOVE
+            else:
+                score = self.capture_score(state, move, see)
+                if not score:
+                    if move in killers:
+                        score = KILLER - killers.index(move)
+                    elif move == countermove:
+                        score = COUNTERMOVE
+                    else:
+                        score = history[move & 0xFFF]
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def cutoff(self, state: State, move: int, ply: int, depth: int):
+        """move caused a cutoff at ply, depth plies from the horizon."""
+        if not self.is_quiet(state, move): return
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        if state.history is not None:
+            self.countermoves[state.history.undo[0] & 0xFFF] = move
+        history = self.history[state.to_move.value]
+        history[move & 0xFFF] += depth * depth
+        if history[move & 0xFFF] > HISTORY_MAX:
+            for i, score in enumerate(history):
+                history[i] = score >> 1
@@ -0,0 +1,310 @@
+import argparse
+import math
+import multiprocessing
+import os
+import queue
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from src.chess import Chess
+from src.evaluation import evaluate_material
+from src.game import Game
+from src.move import Move
+from src.ordering import MoveOrdering
+from src.perft import SUITE
+from src.state import State
+from src.strategy import NULL_WINDOW, alpha_beta_cutoff_search, iterative_deepening_search, pvs_search
+from src.transposition import SharedTranspositionTable, TranspositionTable
+
+# Lazy SMP: several processes run the same iterative deepening search on the
+# same root, sharing one transposition table (SharedTranspositionTable). They
+# do not split the work, they find it done in the table: a position one of
+# them searched is a table hit for the others. To not all follow the same
+# path, the helpers start with shuffled history scores (another quiet move
+# order) and every other one starts a ply deeper.
+#
+# Positions are passed to the processes as a FEN and the moves played since
+# the last capture or pawn move (see pack_state), so the searches see the same
+# repetitions as a search in this process.
+#
+# Root splitting (root_parallel_search) gives the move and score of the serial
+# alpha_beta_cutoff_search: the root moves are searched by a process pool, best
+# moves of a shallow search first, each with the best score found so far as
+# alpha (read again as the workers improve it), then the serial choice is
+# worked out from the results.
+
+def smp_worker(index: int, fen: str, moves: bytes, tt: SharedTranspositionTable, max_depth: int, time_limit, results, eval_fn, options: dict):
+    # runs in a worker process, puts (index, depth, score, action, nodes) on
+    # results after every iteration and (index, None, None, None, nodes) at the end
+    game = unpack_state(fen, moves)
+    ordering = MoveOrdering()
+    if index:
+        rng = random.Random(index)
+        for table in ordering.history:
+            for i in range(len(table)):
+                table[i] = rng.randrange(8)
+    stats = {}
+
+    def report(stats, action):
+        results.put((index, stats["depth"], stats["score"], action, stats["nodes"]))
+
+    iterative_deepening_search(
+        game,
+        game.initial,
+        time_limit=time_limit,
+        max_depth=max_depth,
+        eval_fn=eval_fn,
+        tt=tt,
+        stats=stats,
+        ordering=ordering,
+        search=pvs_search,
+        min_depth=min(index % 2, max_depth),
+        report=report,
+        **options
+    )
+    results.put((index, None, None, None, stats.get("nodes", 0)))
+
+def lazy_smp_search(state: State, workers: int = None, time_limit=None, max_depth=64, eval_fn=evaluate_material, tt: SharedTranspositionTable = None, stats=None, **options):
+    """Search state with workers processes (one per CPU when not given) and
+    return the best action of the deepest iteration one of them finished.
+    The search stops when the time is up or when a worker finished max_depth.
+    Other options are passed on to pvs_search.
+    When given, stats gets the depth, the score, the nodes of all workers and
+    the time the depth took."""
+
+    stats = stats if stats is not None else {}
+    if state.promo:
+        # a promotion choice is not in a FEN, and there are only 4 moves
+        return iterative_deepening_search(
+            Chess(), state, time_limit=time_limit, max_depth=max_depth, eval_fn=eval_fn,
+            tt=tt, stats=stats, search=pvs_search, **options
+        )
+    workers = workers or os.cpu_count()
+    fen, moves = pack_state(state)
+    table = tt if tt is not None else SharedTranspositionTable()
+    table.new_search()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=smp_worker,
+            args=(index, fen, moves, table, max_depth, time_limit, results, eval_fn, options),
+            daemon=True
+        )
+        for index in range(workers)
+    ]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+
+    best = None # (depth, score, action) of the deepest iteration
+    nodes = [0] * workers
+    running = workers
+    try:
+        while running:
+            try:
+                index, depth, score, action, count = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break # a worker died without reporting
+                continue
+            nodes[index] = count
+            if depth is None:
+                running -= 1
+                continue
+            if best is None or depth > best[0]:
+                best = (depth, score, action)
+                stats["time"] = time.monotonic() - start
+            if depth >= max_depth:
+                break # the others cannot do better
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        results.close()
+        if tt is None:
+            table.close()
+
+    stats["nodes"] = sum(nodes)
+    stats["workers"] = workers
+    if best is None:
+        return None
+    stats["depth"], stats["score"] = best[0], best[1]
+    return best[2]
+
+def pack_state(state: State) -> tuple[str, bytes]:
+    # the FEN of the position after the last capture or pawn move and the
+    # moves since then as 16-bit codes: the positions that can still repeat
+    start = state.copy()
+    moves = array("H")
+    while start.history is not None and len(moves) < state.halfmove_clock:
+        moves.append(start.history.undo[0])
+        start.unmake_move()
+    moves.reverse()
+    return start.getFEN(), moves.tobytes()
+
+def unpack_state(fen: str, moves: bytes) -> Chess:
+    # the game of a packed state, its initial state being that state
+    game = Chess(fen)
+    for move in array("H", moves):
+        game.initial.make_move(move)
+    return game
+
+# per pool process: the best score so far and the serial index of its move,
+# shared by the processes, and a table kept from one task to the next
+root_worker = {}
+
+def init_root_worker(best):
+    root_worker["best"] = best
+    root_worker["tt"] = TranspositionTable()
+
+def root_alpha(index: int) -> float:
+    # the alpha of the move of serial index: the best score so far, lowered
+    # by NULL_WINDOW when the serial search would pick this move at that score
+    best = root_worker["best"]
+    with best.get_lock():
+        score, best_index = best[0], best[1]
+    return score - NULL_WINDOW if index < best_index else score
+
+def root_task(task: tuple) -> tuple[int, float, float, int]:
+    # runs in a pool process: (fen, moves, move, index, d, options) ->
+    # (move, alpha searched with, score, nodes)
+    fen, moves, move, index, d, options = task
+    game = unpack_state(fen, moves)
+    best = root_worker["best"]
+    stats = {}
+    alpha_beta_cutoff_search(
+        game, game.initial, d, tt=root_worker["tt"], stats=stats,
+        window=(root_alpha(index), math.inf), root_moves=[move],
+        alpha_bound=lambda: root_alpha(index), **options
+    )
+    # scores are whole numbers, so the alpha only rises: the last one is the
+    # highest the search used
+    alpha = root_alpha(index)
+    score = stats["score"]
+    if score > alpha:
+        with best.get_lock():
+            if score > best[0] or (score == best[0] and index < best[1]):
+                best[0], best[1] = score, index
+    return move, alpha, score, stats["nodes"]
+
+def root_parallel_search(game: Game, state: State, d=4, workers: int = None, stats=None, **options):
+    """Search the root moves of state in workers processes (one per CPU when
+    not given) and return the action alpha_beta_cutoff_search(game, state, d,
+    delta_margin=None, **options) returns, with the same score. Delta pruning
+    is off unless delta_margin is given: with it the scores depend on the
+    window, and the results could differ.
+    The root moves are scored by a search 2 plies shallower. The best of them
+    is searched first, in this process, then the others in the pool by their
+    shallow score (ties in serial order) with the best score so far as alpha,
+    read again every STOP_INTERVAL nodes as the workers improve it. It is
+    lowered by NULL_WINDOW for the moves the serial search sees before the
+    best one (they win a tie). A move still failing low at the best score is
+    searched again if the serial search would have picked it.
+    When given, stats gets the nodes, the score and the moves searched again."""
+
+    options.setdefault("delta_margin", None)
+    stats = stats if stats is not None else {}
+    if state.promo:
+        # a promotion choice is not in a FEN, and there are only 4 moves
+        return alpha_beta_cutoff_search(game, state, d, stats=stats, **options)
+    moves = game.actions(state)
+    if not moves:
+        return None
+    # the root order of the serial search, it picks the first of the best moves
+    serial = list(moves) if not options.get("order_moves", True) else MoveOrdering().order(state, moves, None, 0)
+
+    tt = TranspositionTable()
+    counts = {}
+    shallow = {}
+    for move in serial:
+        alpha_beta_cutoff_search(game, state, max(d - 2, 0), tt=tt, stats=counts, root_moves=[move], **options)
+        shallow[move] = counts["score"]
+    dispatch = sorted(range(len(serial)), key=lambda index: (-shallow[serial[index]], index))
+    first = serial[dispatch[0]]
+    alpha_beta_cutoff_search(game, state, d, tt=tt, stats=counts, root_moves=[first], **options)
+    results = {first: (-math.inf, counts["score"])} # move: (alpha, score)
+
+    fen, tail = pack_state(state)
+    best = multiprocessing.Array("d", [counts["score"], dispatch[0]])
+    tasks = [(fen, tail, serial[index], index, d, options) for index in dispatch[1:]]
+    nodes = counts["nodes"]
+    with ProcessPoolExecutor(workers, initializer=init_root_worker, initargs=(best,)) as pool:
+        for move, searched_alpha, score, count in pool.map(root_task, tasks):
+            results[move] = (searched_alpha, score)
+            nodes += count
+
+    # the scores above their alpha are exact, the best of them is the score
+    best_score = max(score for searched_alpha, score in results.values() if score > searched_alpha)
+    best_action = None
+    researched = 0
+    for move in serial:
+        searched_alpha, score = results[move]
+        if score > searched_alpha:
+            if score == best_score:
+                best_action = move
+                break
+        elif searched_alpha >= best_score:
+            # failed low at the best score: is it the best score?
+            researched += 1
+            counts = {}
+            alpha_beta_cutoff_search(
+                game, state, d, tt=tt, stats=counts,
+                window=(best_score - NULL_WINDOW, math.inf), root_moves=[move], **options
+            )
+            nodes += counts["nodes"]
+            if counts["score"] > best_score - NULL_WINDOW:
+                best_action = move
+                break
+
+    stats["nodes"] = stats.get("nodes", 0) + nodes
+    stats["score"] = best_score
+    stats["researched"] = researched
+    return best_action
+
+def speedup(depth: int, counts: list[int], fens: list[str]):
+    # time to depth of the positions per worker count, against the first count
+    times = {}
+    for workers in counts:
+        total = 0.0
+        for fen in fens:
+            stats = {}
+            lazy_smp_search(State(fen), workers, max_depth=depth, stats=stats)
+            total += stats.get("time", 0.0)
+            print(f"{workers} workers: depth {stats.get('depth')} in {stats.get('time', 0.0):.2f}s, {stats['nodes']} nodes, {fen}")
+        times[workers] = total
+        print(f"{workers} workers: {total:.2f}s, speedup {times[counts[0]] / max(total, 1e-9):.2f}")
+
+def compare_root(depth: int, counts: list[int], fens: list[str]):
+    # root splitting against the serial search: same move and score, and time
+    for fen in fens:
+        game = Chess(fen)
+        stats = {}
+        start = time.perf_counter()
+        move = alpha_beta_cutoff_search(game, game.initial, depth, eval_fn=evaluate_material, stats=stats, delta_margin=None)
+        serial = time.perf_counter() - start
+        print(f"serial: {Move.fromCode(move).getFEN()} score {stats['score']} in {serial:.2f}s, {fen}")
+        for workers in counts:
+            parallel_stats = {}
+            start = time.perf_counter()
+            parallel_move = root_parallel_search(game, game.initial, depth, workers, eval_fn=evaluate_material, stats=parallel_stats)
+            elapsed = time.perf_counter() - start
+            same = "same" if (parallel_move, parallel_stats["score"]) == (move, stats["score"]) else "DIFFERENT"
+            print(f"{workers} workers: {Move.fromCode(parallel_move).getFEN()} score {parallel_stats['score']} in {elapsed:.2f}s, {same}, speedup {serial / max(elapsed, 1e-9):.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to depth of the parallel searches per number of workers.")
+    parser.add_argument("depth", type=int, nargs="?", default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--fen", help="a position instead of the perft positions")
+    parser.add_argument("--root", action="store_true", help="root splitting against the serial search instead of lazy SMP")
+    args = parser.parse_args()
+    fens = [args.fen] if args.fen else [fen for _, fen, _ in SUITE]
+    if args.root:
+        compare_root(args.depth, args.workers, fens)
+    else:
+        speedup(args.depth, args.workers, fens)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from src.bitboard import ROWS, piece_index
+from src.move import Move
+from src.piece import Piece, PieceColor, PieceType
+from src.state import State
+
+# Perft counts the leaf nodes of the legal move tree to a fixed depth. The
+# counts are known for the positions below, so they validate the move
+# generator, and the time they take benchmarks it.
+#
+# A promotion is played in two steps here (the pawn move, then the choice of
+# piece, see State.make_move), perft counts both steps as one ply like the
+# reference numbers do. Rule draws are ignored, as usual for perft.
+
+SUITE = [
+    ("start", State.START_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594])
+]
+
+def promotions(state: State, moves) -> int:
+    # moves of the pawns about to promote, each of them is 4 moves
+    pawn = Piece(PieceType.PAWN, state.to_move)
+    pawns = state.bitboards[piece_index(pawn)] & ROWS[1 if state.to_move == PieceColor.WHITE else 6]
+    return sum(1 for move in moves if pawns >> (move & 63) & 1)
+
+def perft(state: State, depth: int) -> int:
+    if depth <= 0:
+        return 1
+
+    moves = state.legal_moves(packed=True)
+    if depth == 1 and not state.promo:
+        # bulk counting: the leaves are not played
+        return len(moves) + 3 * promotions(state, moves)
+
+    nodes = 0
+    for move in moves:
+        state.make_move(move)
+        if state.promo:
+            # choosing the piece is the same ply
+            nodes += perft(state, depth)
+        else:
+            nodes += perft(state, depth - 1)
+        state.unmake_move()
+    return nodes
+
+def uci(code: int) -> str:
+    # lowercase promotion piece (e7e8q), as reference engines print divide
+    return Move.fromCode(code).getFEN().lower()
+
+def divide(state: State, depth: int) -> list[tuple[str, int]]:
+    """Perft of each root move, promotions are listed per piece (e7e8q)."""
+    counts = []
+    for move in state.legal_moves(packed=True):
+        state.make_move(move)
+        if state.promo:
+            for promotion in state.legal_moves(packed=True):
+                state.make_move(promotion)
+                counts.append((uci(move | (promotion & ~0xFFF)), perft(state, depth - 1)))
+                state.unmake_move()
+        else:
+            counts.append((uci(move), perft(state, depth - 1)))
+        state.unmake_move()
+    return counts
+
+def split(state: State, plies: int, path=()) -> list[tuple[tuple[str], str]]:
+    """Positions after plies moves (with the moves leading to them) as FENs."""
+    if plies == 0:
+        return [(path, state.getFEN())]
+    positions = []
+    for move in state.legal_moves(packed=True):
+        state.make_move(move)
+        if state.promo:
+            # a FEN cannot hold the pending promotion, so it is played here
+            for promotion in state.legal_moves(packed=True):
+                state.make_move(promotion)
+                label = uci(move | (promotion & ~0xFFF))
+                positions += split(state, plies - 1, path + (label,))
+                state.unmake_move()
+        else:
+            positions += split(state, plies - 1, path + (uci(move),))
+        state.unmake_move()
+    return positions
+
+def perft_task(task: tuple[str, int]) -> tuple[int, int, float]:
+    # runs in a worker process: (fen, depth) -> (worker pid, nodes, seconds)
+    fen, depth = task
+    start = time.perf_counter()
+    nodes = perft(State(fen), depth)
+    return os.getpid(), nodes, time.perf_counter() - start
+
+def parallel_perft(fen: str, depth: int, workers: int = None, plies: int = 1) -> tuple[int, dict]:
+    """Perft with the subtrees after the first plies counted by a process pool.
+
+    Returns the node count and, per worker pid, [tasks, nodes, seconds].
+    """
+    plies = min(plies, depth)
+    positions = split(State(fen), plies)
+    stats = {}
+    nodes = 0
+    with ProcessPoolExecutor(workers) as pool:
+        # one position per task, so a worker stuck on a big subtree does not hold back the others
+        tasks = [(fen, depth - plies) for _, fen in positions]
+        for pid, count, elapsed in pool.map(perft_task, tasks):
+            worker = stats.setdefault(pid, [0, 0, 0.0])
+            worker[0] += 1
+            worker[1] += count
+            worker[2] += elapsed
+            nodes += count
+    return nodes, stats
+
+def run_parallel(fen: str, depth: int, workers: int, plies: int) -> int:
+    start = time.perf_counter()
+    nodes, stats = parallel_perft(fen, depth, workers, plies)
+    elapsed = time.perf_counter() - start
+    for pid, (tasks, count, busy) in sorted(stats.items()):
+        print(f"worker {pid}: {tasks} positions, {count} nodes in {busy:.2f}s")
+    print(f"depth {depth}: {nodes} nodes in {elapsed:.2f}s ({nodes / max(elapsed, 1e-9):.0f} nps, {len(stats)} workers)")
+    return nodes
+
+def run(fen: str, depth: int, show_divide=False) -> int:
+    state = State(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(state, depth)
+        for move, nodes in counts:
+            print(f"{move}: {nodes}")
+        nodes = sum(nodes for _, nodes in counts)
+    else:
+        nodes = perft(state, depth)
+    elapsed = time.perf_counter() - start
+    print(f"depth {depth}: {nodes} nodes in {elapsed:.2f}s ({nodes / max(elapsed, 1e-9):.0f} nps)")
+    return nodes
+
+def run_suite(max_depth: int) -> bool:
+    ok = True
+    for name, fen, expected in SUITE:
+        for depth, count in enumerate(expected[:max_depth], 1):
+            start = time.perf_counter()
+            nodes = perft(State(fen), depth)
+            elapsed = time.perf_counter() - start
+            status = "ok" if nodes == count else f"FAIL (expected {count})"
+            ok = ok and nodes == count
+            print(f"{name} depth {depth}: {nodes} {status} {elapsed:.2f}s ({nodes / max(elapsed, 1e-9):.0f} nps)")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the legal move tree of a position.")
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("--fen", default=State.START_FEN)
+    parser.add_argument("--divide", action="store_true", help="show the count of each root move")
+    parser.add_argument("--suite", action="store_true", help="check the standard positions up to depth")
+    parser.add_argument("--workers", type=int, default=0, help="count the subtrees in this many processes")
+    parser.add_argument("--split", type=int, default=1, help="plies played before handing positions to the workers")
+    args = parser.parse_args()
+    if args.divide and args.depth < 1:
+        parser.error("--divide needs a depth of at least 1")
+
+    if args.suite:
+        raise SystemExit(0 if run_suite(args.depth) else 1)
+    if args.workers:
+        run_parallel(args.fen, args.depth, args.workers, args.split)
+    else:
+        run(args.fen, args.depth, args.divide)
+
+if __name__ == "__main__":
+    main()
@@ -19,13 +19,26 @@ def opponent(color: PieceColor):
 PIECE_TYPES = [ PieceType(i) for i in range(1, len(PieceType)) ]
 PIECE_COLORS = [ PieceColor(i) for i in range(len(PieceColor)) ]
 PIECE_NAMES = [None, 'pawn', 'knight', 'bishop', 'rook', 'queen', 'king']
+PROMOTION_TYPES = [PieceType.QUEEN, PieceType.KNIGHT, PieceType.BISHOP, PieceType.ROOK]
 
 class Piece:
+    # Pieces are immutable and interned: there are only 13 of them (the empty
+    # piece and 6 types of each color), Piece(type, color) looks them up.
+    # code is 0 for the empty piece, else color * 6 + type (1 to 12).
+    __slots__ = ("type", "color", "code")
     
+    def __new__(cls, type: PieceType = PieceType.NONE, color: PieceColor = PieceColor.WHITE):
+        if type == PieceType.NONE:
+            return PIECE_TABLE[0]
+        return PIECE_TABLE[color.value * 6 + type.value]
     
-    def __init__(self, type: PieceType = PieceType.NONE, color: PieceColor = PieceColor.WHITE) -> None:
-        self.type = type
-        self.color = color
+    @staticmethod
+    def create(type: PieceType, color: PieceColor):
+        piece = object.__new__(Piece)
+        object.__setattr__(piece, "type", type)
+        object.__setattr__(piece, "color", color)
+        object.__setattr__(piece, "code", 0 if type == PieceType.NONE else color.value * 6 + type.value)
+        return piece
         
     def getFEN(self) -> str:
         if self.type == PieceType.NONE:
@@ -53,7 +66,21 @@ class Piece:
         
     def __repr__(self) -> str:
         return self.getFEN()
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("Piece is immutable")
+    
+    def __reduce__(self):
+        return (Piece, (self.type, self.color))
 
     def __eq__(self, value: object) -> bool:
-        return self.type == value.type and self.color == value.color
+        return self is value
+    
+    def __hash__(self) -> int:
+        return self.code
 
+PIECE_TABLE = [Piece.create(PieceType.NONE, PieceColor.WHITE)] + [
+    Piece.create(piece_type, piece_color)
+    for piece_color in PIECE_COLORS
+    for piece_type in PIECE_TYPES
+]
@@ -1,24 +1,117 @@
 import random
+from src.clock import Clock
 from src.evaluation import evaluate_material
 from src.game import Game
+from src.move import Move
+from src.ordering import MoveOrdering
+from src.parallel import lazy_smp_search, root_parallel_search
+from src.ponder import Ponderer
 from src.state import State
-from src.strategy import alpha_beta_cutoff_search
+from src.strategy import NULL_MOVE_REDUCTION, iterative_deepening_search, pvs_search
+from src.transposition import SharedTranspositionTable, TranspositionTable
 
 def random_player(game: Game, state: State):
     actions = game.actions(state)
     if actions:
-        return random.choice(game.actions(state))
+        return Move.fromCode(random.choice(actions))
     return None
 
-def leveled_player(level=1):
+def leveled_player(level=1, tt_mb=16, time_limit=None, reduction=NULL_MOVE_REDUCTION, workers=0, ponder=False, root_split=False):
+    # with a time_limit (seconds per move) the search deepens up to the level
+    # depth and stops earlier when the time is up
+    # reduction is the R of null move pruning (see pvs_search), 0 turns it off
+    # with workers > 1 that many processes search together (see parallel.py)
+    # with ponder it goes on searching while the opponent thinks (see ponder.py)
+    # with root_split the move is the one alpha_beta_cutoff_search finds at the
+    # level depth, the root moves searched by workers processes (one per CPU
+    # with 0) by root_parallel_search: reproducible, but without the null
+    # move pruning, late move reductions and futility pruning of pvs_search,
+    # so not the move of the other modes. It always searches to the depth
+    # (no time_limit) and does not ponder
     
-    def player(game: Game, state: State):
-        return alpha_beta_cutoff_search(
+    depth = (level-1)*2 + 1
+    
+    # kept from one move to the next
+    tt = SharedTranspositionTable(tt_mb) if workers > 1 or ponder else TranspositionTable(tt_mb)
+    ordering = MoveOrdering()
+    ponderer = Ponderer(tt, depth, evaluate_material, null_move=reduction) if ponder and not root_split else None
+    
+    def search(game: Game, state: State):
+        if root_split:
+            return root_parallel_search(
+                game,
+                state,
+                d=depth,
+                workers=workers or None,
+                eval_fn=evaluate_material
+            )
+        if workers > 1:
+            return lazy_smp_search(
+                state,
+                workers,
+                time_limit=time_limit,
+                max_depth=depth,
+                eval_fn=evaluate_material,
+                tt=tt,
+                null_move=reduction
+            )
+        if time_limit is not None:
+            return iterative_deepening_search(
+                game,
+                state,
+                time_limit=time_limit,
+                max_depth=depth,
+                eval_fn=evaluate_material,
+                tt=tt,
+                ordering=ordering,
+                search=pvs_search,
+                null_move=reduction
+            )
+        return pvs_search(
             game, 
             state, 
-            d=(level-1)*2 + 1, 
-            cutoff_test=None, 
-            eval_fn=evaluate_material
+            d=depth, 
+            eval_fn=evaluate_material,
+            tt=tt,
+            ordering=ordering,
+            null_move=reduction
+        )
+    
+    def player(game: Game, state: State):
+        move = None
+        if ponderer is not None:
+            pondered = ponderer.stop(state)
+            if pondered.get("depth", -1) >= depth:
+                move = pondered["action"] # ponder hit, already searched to the depth
+        if move is None:
+            move = search(game, state)
+        if ponderer is not None and move is not None:
+            ponderer.start(state, move)
+        return None if move is None else Move.fromCode(move)
+    
+    player.ponderer = ponderer
+    return player
+
+def timed_player(seconds=300, increment=0, moves_to_go=None, tt_mb=16):
+    # plays a whole game on a clock, see clock.py
+    
+    clock = Clock(seconds, increment, moves_to_go)
+    tt = TranspositionTable(tt_mb)
+    ordering = MoveOrdering()
+    
+    def player(game: Game, state: State):
+        deadline = clock.start()
+        move = iterative_deepening_search(
+            game,
+            state,
+            deadline=deadline,
+            eval_fn=evaluate_material,
+            tt=tt,
+            ordering=ordering,
+            search=pvs_search
         )
+        clock.stop()
+        return None if move is None else Move.fromCode(move)
     
+    player.clock = clock
     return player
\ No newline at end of file
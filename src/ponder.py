@@ -0,0 +1,102 @@
+import multiprocessing
+import queue
+from src.evaluation import evaluate_material
+from src.parallel import pack_state, unpack_state
+from src.state import State
+from src.strategy import iterative_deepening_search, pvs_search
+from src.transposition import SharedTranspositionTable
+
+# Pondering: while the opponent thinks, a background process searches the
+# position after the reply the search expects (the best move of the table
+# after our move). It fills the shared table of the player, so on a ponder hit
+# the next search finds the tree already searched, and returns at once when
+# the pondering reached its depth. On a miss the process is stopped, the
+# entries it stored are still good for the positions they belong to.
+
+def ponder_worker(fen: str, moves: bytes, tt: SharedTranspositionTable, max_depth: int, results, eval_fn, options: dict):
+    # runs in the ponder process, puts (depth, score, action, nodes) on results
+    # after every iteration
+    game = unpack_state(fen, moves)
+
+    def report(stats, action):
+        results.put((stats["depth"], stats["score"], action, stats["nodes"]))
+
+    iterative_deepening_search(
+        game,
+        game.initial,
+        max_depth=max_depth,
+        eval_fn=eval_fn,
+        tt=tt,
+        search=pvs_search,
+        report=report,
+        **options
+    )
+
+class Ponderer:
+
+    def __init__(self, tt: SharedTranspositionTable, max_depth=64, eval_fn=evaluate_material, **options) -> None:
+        # options are passed on to pvs_search
+        self.tt = tt
+        self.max_depth = max_depth
+        self.eval_fn = eval_fn
+        self.options = options
+        self.process = None
+        self.results = None
+        self.key = None # of the position pondered on
+        self.hits = 0
+        self.misses = 0
+
+    def expected_reply(self, state: State, move: int) -> int:
+        # the best move of the table after move, None if there is none
+        after = state.copy()
+        after.make_move(move)
+        if after.promo or after.result is not None: return None
+        entry = self.tt.probe(after.key)
+        if entry is None or entry[4] not in after.legal_moves(packed=True): return None
+        return entry[4]
+
+    def start(self, state: State, move: int) -> bool:
+        """Ponder on the position after move from state and the expected reply."""
+        self.stop()
+        reply = self.expected_reply(state, move)
+        if reply is None: return False
+        position = state.copy()
+        position.make_move(move)
+        position.make_move(reply)
+        if position.promo or position.result is not None: return False
+        fen, moves = pack_state(position)
+        self.key = position.key
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=ponder_worker,
+            args=(fen, moves, self.tt, self.max_depth, self.results, self.eval_fn, self.options),
+            daemon=True
+        )
+        self.process.start()
+        return True
+
+    def stop(self, state: State = None) -> dict:
+        """Stop pondering. With the state the opponent's move led to, returns
+        on a ponder hit the last iteration the pondering finished (depth,
+        score, action, nodes), an empty dict before the first one or on a miss."""
+        if self.process is None: return {}
+        self.process.terminate()
+        self.process.join()
+        last = {}
+        while True:
+            try:
+                depth, score, action, nodes = self.results.get_nowait()
+            except queue.Empty:
+                break
+            last = {"depth": depth, "score": score, "action": action, "nodes": nodes}
+        self.results.close()
+        self.process = None
+        if state is None: return {}
+        if state.key == self.key:
+            self.hits += 1
+            return last
+        self.misses += 1
+        return {}
+
+    def is_pondering(self) -> bool:
+        return self.process is not None
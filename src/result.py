@@ -19,6 +19,8 @@ RESULT_TYPE_NAMES = [
     'stalemate',
     'insufficient material',
     '75 moves',
+    'fivefold repetition',
+    '50 moves',
     'threefold repetition',
     # 'variant win',
     # 'variant loss',
@@ -1,18 +1,35 @@
-from copy import deepcopy
-from src.cell import Cell
-from src.fen import parseBoard, parseCell, parseMove, parsePiece
+from array import array
+from src.attacks import BETWEEN, DIAGONAL_DIRECTIONS, KING_ATTACKS, KNIGHT_ATTACKS, ORTHOGONAL_DIRECTIONS, PAWN_ATTACKS, RAYS
+from src.bitboard import BISHOPS, FULL, KINGS, KNIGHTS, PAWNS, PIECES, QUEENS, ROOKS, ROWS, lsb, piece_index, popcount, squares
+from src.cell import CELLS, Cell
+from src.fen import parseBoard, parseCell, parsePiece
+from src.history import History
+from src.magic import bishop_attacks, queen_attacks, rook_attacks
 from src.move import Move
-from src.piece import Piece, PieceColor, PieceType, opponent
+from src.piece import PROMOTION_TYPES, Piece, PieceColor, PieceType, opponent
 from src.result import Result, ResultType
+from src.zobrist import BLACK_TO_MOVE_KEY, PIECE_KEYS, castling_key, en_passant_key
+
+# castling rights (KQkq) lost by a move from or to these squares
+CASTLING_SQUARES = {
+    parseCell("e1"): [0, 1], parseCell("h1"): [0], parseCell("a1"): [1],
+    parseCell("e8"): [2, 3], parseCell("h8"): [2], parseCell("a8"): [3]
+}
+
+# material by PieceType value for the exchange evaluation (State.see), the
+# values of evaluation.py
+SEE_VALUES = [0, 1, 3, 3, 5, 9, 200]
 
 class State:
     BOARD_SIZE = 8
     START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
     EMPTY_CELL = Piece()
+    UNKNOWN_RESULT = object() # result not computed yet, see result
     
     def __init__(self, fen=START_FEN) -> None:
         
-        self.result = None
+        self._result = State.UNKNOWN_RESULT
+        self._moves = None # legal moves of the side to move, see legal_moves()
         
         # board
         self.board: list[list[Piece]] = [
@@ -30,37 +47,75 @@ class State:
         self.fullmove_number = 1
         
         # helper states
-        self.piecemap = dict([
-            (p, [])
-            for p in ['p', 'n', 'b', 'r', 'q', 'k', 'P', 'N', 'B', 'R', 'Q', 'K']
-        ])
-        self.move_stack = [] 
-        self.check_stack = []
+        self.bitboards = [0 for _ in PIECES] # one bitboard per piece, see bitboard.py
+        self.occupancy = [0, 0] # squares taken by white / black pieces
+        self.history = None # last History node, None before the first move
+        self.key = 0 # zobrist key, see zobrist.py
         self.check = False # check if current state is a check
         self.promo = False # check if a player should promote a pawn
         
-        self.temp_castling_revoked = [False, False, False, False]
-        
         # parse input
         self.parseFEN(fen)
         
+    @property
+    def result(self) -> Result:
+        # computed on first access only, so making a move does not pay for
+        # a legal move generation of the new position
+        if self._result is State.UNKNOWN_RESULT:
+            self._result = self.compute_result()
+        return self._result
+    
+    @result.setter
+    def result(self, result: Result):
+        self._result = result
+    
+    def compute_result(self) -> Result:
+        if self.promo: return None
+        if not self.legal_moves(packed=True):
+            if self.is_checking():
+                return Result(ResultType.CHECKMATE, opponent(self.to_move))
+            return Result(ResultType.STALEMATE)
+        if self.is_75_moves():
+            return Result(ResultType.SEVENTYFIVE_MOVES)
+        if self.is_fivefold_repetition():
+            return Result(ResultType.FIVEFOLD_REPETITION)
+        return None
+    
+    @property
+    def move_stack(self) -> list[Move]:
+        # moves played so far, built from the history
+        return [] if self.history is None else [
+            Move.fromCode(node.undo[0]) for node in self.history.nodes()
+        ]
+    
+    @property
+    def check_stack(self) -> list[bool]:
+        return [] if self.history is None else [
+            node.check for node in self.history.nodes() if node.check is not None
+        ]
+    
     def game_over(self):
         return self.result is not None
         
     def out_of_board(self, cell: Cell):
-        if 0 <= cell.row < State.BOARD_SIZE and 0 <= cell.col < State.BOARD_SIZE:
-            return False
-        return True
+        # only the 64 interned board cells have an index
+        return cell.index < 0
         
     def get_piece_locations(self, piece: Piece) -> list[Cell]:
-        return self.piecemap[piece.getFEN()]
+        return [
+            Cell.fromIndex(index)
+            for index in squares(self.bitboards[piece_index(piece)])
+        ]
     
     def count_pieces(self, piece: Piece):
-        return len(self.piecemap[piece.getFEN()])
+        return popcount(self.bitboards[piece_index(piece)])
+    
+    def occupied(self) -> int:
+        return self.occupancy[0] | self.occupancy[1]
     
     def at(self, cell: Cell) -> Piece:
         
-        if self.out_of_board(cell):
+        if cell.index < 0:
             # return None
             raise Exception(f"Out of board")
         
@@ -68,582 +123,468 @@ class State:
     
     def set_piece(self, cell: Cell, new_piece: Piece):
         
-        if self.out_of_board(cell):
+        square = cell.index
+        if square < 0:
             raise Exception(f"Out of board")
         
-        old_piece = self.at(cell)
-        if old_piece != State.EMPTY_CELL:
-            self.piecemap[old_piece.getFEN()].remove(cell)
+        bit = 1 << square
+        row = self.board[cell.row]
         
-        self.board[cell.row][cell.col] = new_piece
+        # piece codes: 0 is empty, the bitboard index is code - 1 (see bitboard.py)
+        index = row[cell.col].code - 1
+        if index >= 0:
+            self.bitboards[index] ^= bit
+            self.occupancy[index // 6] ^= bit
+            self.key ^= PIECE_KEYS[index][square]
         
-        if new_piece != State.EMPTY_CELL:
-            self.piecemap[new_piece.getFEN()].append(cell)
+        row[cell.col] = new_piece
+        
+        index = new_piece.code - 1
+        if index >= 0:
+            self.bitboards[index] |= bit
+            self.occupancy[index // 6] |= bit
+            self.key ^= PIECE_KEYS[index][square]
     
+    def copy(self):
+
+        state = State.__new__(State)
+        state.__dict__.update(self.__dict__)
+
+        # pieces, cells and history nodes are never mutated, only the containers are copied
+        state.board = [row[:] for row in self.board]
+        state.bitboards = self.bitboards[:]
+        state.occupancy = self.occupancy[:]
+        state.castling_rights = self.castling_rights[:]
+
+        return state
+
     def move(self, move: Move, update=True):
-        
-        fromCell = move.fromCell
-        toCell = move.toCell
-        
-        if not self.at(fromCell) or not self.at(toCell):
-            raise Exception(f"Invalid move: {fromCell} -> {toCell}")
-        
-        state = deepcopy(self)
-        
+        state = self.copy()
+        state.make_move(move, update)
+        return state
+
+    def make_move(self, move, update=True):
+        # move is a Move or its packed code (see move.py), the search plays codes
+
+        if isinstance(move, Move):
+            if self.out_of_board(move.fromCell) or self.out_of_board(move.toCell):
+                raise Exception(f"Invalid move: {move.fromCell} -> {move.toCell}")
+            move = move.code
+
+        fromCell = CELLS[move & 63]
+        toCell = CELLS[move >> 6 & 63]
+
         # promo move
-        isPromoMove = move.is_promotion()
-        promoSimulatedState = None
+        isPromoMove = move >> 12 != 0
 
         if isPromoMove:
             if not self.promo:
                 print(self.getFEN())
                 raise Exception(f"Invalid promotion: not a promo state")
-            if fromCell != toCell:
-                raise Exception(f"Invalid promotion: {move}")
-            state.set_piece(fromCell, Piece(move.promotion, self.to_move))
-            promoSimulatedState = deepcopy(state)
-            state.promo = False
-            if update:
-                state.to_move = opponent(self.to_move)
-        
+            if fromCell is not toCell:
+                raise Exception(f"Invalid promotion: {Move.fromCode(move)}")
+
+        # everything up to the board update is decided on the position before the move
+        to_move = self.to_move
+        piece = self.board[fromCell.row][fromCell.col]
+        captured = self.board[toCell.row][toCell.col]
+        capturedCell = toCell
+        isPawn = piece.type == PieceType.PAWN
+
+        if isPawn and fromCell.col != toCell.col and captured is State.EMPTY_CELL:
+            # en passant: the captured pawn is next to the moving one
+            capturedCell = CELLS[fromCell.row * 8 + toCell.col]
+            captured = self.at(capturedCell)
+
+        toBePromoted = not isPromoMove and isPawn and toCell.row == (0 if to_move == PieceColor.WHITE else 7)
+
+        rookFromCell = None
+        rookToCell = None
+        if piece.type == PieceType.KING and not isPromoMove:
+            # castling: the king moves two squares, the rook jumps over it
+            if toCell.col - fromCell.col == 2:
+                rookFromCell = CELLS[fromCell.index + 3]
+                rookToCell = CELLS[fromCell.index + 1]
+            elif fromCell.col - toCell.col == 2:
+                rookFromCell = CELLS[fromCell.index - 4]
+                rookToCell = CELLS[fromCell.index - 1]
+
+        # undo record, see unmake_move()
+        undo = (
+            move, piece, captured, capturedCell, rookFromCell, rookToCell,
+            tuple(self.castling_rights),
+            self.en_passant_target, self.halfmove_clock, self.fullmove_number,
+            to_move, self.check, self.promo, self._result, self._moves, self.key
+        )
+
+        if update:
+            isHalfMove = not isPawn and captured is State.EMPTY_CELL
+
+            new_en_passant_target = None
+            if isPawn and abs(toCell.row - fromCell.row) == 2:
+                # only set when an enemy pawn can take it
+                enemy_pawns = self.bitboards[piece_index(Piece(PieceType.PAWN, opponent(to_move)))]
+                if enemy_pawns & ROWS[toCell.row] & KING_ATTACKS[toCell.index]:
+                    new_en_passant_target = CELLS[(fromCell.index + toCell.index) // 2]
+
+        if isPromoMove:
+            self.set_piece(fromCell, Piece(PieceType(move >> 12), to_move))
+            self.promo = False
+
         # not promo
-        else:            
-            piece = self.at(fromCell)
-            state.set_piece(fromCell, State.EMPTY_CELL)
-            state.set_piece(toCell, piece)
-            
+        else:
+            self.set_piece(fromCell, State.EMPTY_CELL)
+            if capturedCell is not toCell:
+                self.set_piece(capturedCell, State.EMPTY_CELL)
+            self.set_piece(toCell, piece)
+
             # add rook move for castling
-            if self.is_kingside_castling(move):
-                
-                rookCell = None
-                if self.to_move == PieceColor.WHITE:
-                    rookCell = parseCell("h1")
-                else:
-                    rookCell = parseCell("h8")
-                    
-                rook = self.at(rookCell)
-                state.set_piece(rookCell, State.EMPTY_CELL)
-                state.set_piece(toCell.toLeft(), rook)
-                    
-            elif self.is_queenside_castling(move):
-                
-                rookCell = None
-                if self.to_move == PieceColor.WHITE:
-                    rookCell = parseCell("a1")
-                else:
-                    rookCell = parseCell("a8")
-                
-                rook = self.at(rookCell)
-                state.set_piece(rookCell, State.EMPTY_CELL)
-                state.set_piece(toCell.toRight(), rook)
-        
-        state.move_stack.append(move)
-        
-        
-        toBePromoted = (
-            promoSimulatedState.is_pawn_promo_move(move) if isPromoMove
-            else self.is_pawn_promo_move(move)
-        )
-        
+            if rookFromCell is not None:
+                rook = self.at(rookFromCell)
+                self.set_piece(rookFromCell, State.EMPTY_CELL)
+                self.set_piece(rookToCell, rook)
+
         if toBePromoted:
-            state.promo = True # let player choose which one to promo
-        else:
-            if update:
-                state.to_move = opponent(self.to_move)
-        
-        if not update:    
-            return state   
-        
-        # if not update:    
-        #     return state
-        
-        isCheck = (
-            promoSimulatedState.is_check(move) if isPromoMove 
-            else self.is_check(move)
-        )
-        if isCheck: 
-            state.check_stack.append(True)
-            state.check = True
-            
-            if state.is_checkmate():
-                state.result = Result(ResultType.CHECKMATE, opponent(self.to_move))
-                return state
-        else:
-            state.check_stack.append(False)
-            state.check = False
-            
-            if state.is_stalemate():
-                state.result = Result(ResultType.STALEMATE)
-                return state 
-            
-        # if self.is_checkmate():
-        #     state.result = Result(ResultType.CHECKMATE, opponent(self.to_move))
-        #     return state
-        # if self.is_stalemate():
-        #     state.result = Result(ResultType.STALEMATE)
-        #     return state 
-        # state.to_move = opponent(self.to_move)
-        
+            self.promo = True # let player choose which one to promo
+        elif update:
+            self.to_move = opponent(to_move)
+            self.key ^= BLACK_TO_MOVE_KEY
+
+        self._result = State.UNKNOWN_RESULT
+        self._moves = None
+
+        if not update:
+            self.history = History(undo, None, self.history)
+            return
+
+        self.check = self.is_checking()
+
         # castling right state switch -----------------------------------------------
-        
-        # TODO
-        # CASE: gain castling right after temporary revoke, if no more check
-        if not self.is_checking():
-            if self.at(parseCell("e8")).getFEN() == "k":
-                if self.temp_castling_revoked[2]:   
-                    state.castling_rights[2] = True
-                    state.temp_castling_revoked[2] = False
-                if self.temp_castling_revoked[3]:   
-                    state.castling_rights[3] = True
-                    state.temp_castling_revoked[3] = False
-            if self.at(parseCell("e1")).getFEN() == "K":
-                if self.temp_castling_revoked[0]:   
-                    state.castling_rights[0] = True
-                    state.temp_castling_revoked[0] = False
-                if self.temp_castling_revoked[1]:   
-                    state.castling_rights[1] = True    
-                    state.temp_castling_revoked[1] = False
-        
-        # check castling move
-        if self.is_kingside_castling(move):
-            if self.to_move == PieceColor.WHITE:
-                state.castling_rights[0] = False
-            else:
-                state.castling_rights[2] = False
-        elif self.is_queenside_castling(move):
-            if self.to_move == PieceColor.WHITE:
-                state.castling_rights[1] = False
-            else:
-                state.castling_rights[3] = False
-                
-        # check disabled castling rights
-        
-        # CASE: moved king/rook
-        if self.is_empty_cell(fromCell): raise Exception("Moving nothing!")
-        moved_piece = self.at(fromCell)
-        
-            # case: K moved
-        if fromCell.getFEN() == "e1" and moved_piece.getFEN() == "K":
-            
-            if self.castling_rights[0]:
-                state.castling_rights[0] = False
-            if self.castling_rights[1]:
-                state.castling_rights[1] = False
-            
-            # case: left R moved
-        if fromCell.getFEN() == "a1" and moved_piece.getFEN() == "R" and self.castling_rights[1]:
-            state.castling_rights[1] = False
-            
-            # case right R moved
-        if fromCell.getFEN() == "h1" and moved_piece.getFEN() == "R" and self.castling_rights[0]:
-            state.castling_rights[0] = False
-            
-            # case: k moved
-        if fromCell.getFEN() == "e8" and moved_piece.getFEN() == "k":
-            
-            if self.castling_rights[2]:
-                state.castling_rights[2] = False
-            if self.castling_rights[3]:
-                state.castling_rights[3] = False
-                
-            # case: left r moved
-        if fromCell.getFEN() == "a8" and moved_piece.getFEN() == "r" and self.castling_rights[3]:
-            state.castling_rights[3] = False
-            
-            # case: right r moved
-        if fromCell.getFEN() == "h8" and moved_piece.getFEN() == "r" and self.castling_rights[2]:
-            state.castling_rights[2] = False
-        
-        # TODO
-        # CASE: check opponent king --> disabled opponent's castling right (temporary revoke)
-        if state.check:
-            if self.to_move == PieceColor.WHITE:
-                if self.castling_rights[2]:
-                    state.castling_rights[2] = False
-                    state.temp_castling_revoked[2] = True
-                if self.castling_rights[3]:
-                    state.castling_rights[3] = False
-                    state.temp_castling_revoked[3] = True
-            else:
-                if self.castling_rights[0]:
-                    state.castling_rights[0] = False
-                    state.temp_castling_revoked[0] = True
-                if self.castling_rights[1]:
-                    state.castling_rights[1] = False
-                    state.temp_castling_revoked[1] = True
+        # a right is lost for good once its king or rook leaves its square or the rook is captured
+        self.key ^= castling_key(self.castling_rights)
+        for cell in (fromCell, toCell):
+            for right in CASTLING_SQUARES.get(cell, ()):
+                self.castling_rights[right] = False
+        self.key ^= castling_key(self.castling_rights)
         
         # en passant target state switch ---------------------------------
-        if self.en_passant_target:
-            state.en_passant_target = None
-        else:
-            if self.is_pawn_double_move(move):
-                pawn_cell = move.toCell
-                
-                left = pawn_cell.toLeft()
-                right = pawn_cell.toRight()
-                
-                if not self.out_of_board(left):
-                    if self.at(left) == Piece(PieceType.PAWN, opponent(self.to_move)):
-                        if self.to_move == PieceColor.WHITE:
-                            state.en_passant_target = pawn_cell.toDown()
-                        else:
-                            state.en_passant_target = pawn_cell.toUp()
-                
-                if not self.out_of_board(right):
-                    if self.at(right) == Piece(PieceType.PAWN, opponent(self.to_move)):
-                        if self.to_move == PieceColor.WHITE:
-                            state.en_passant_target = pawn_cell.toDown()
-                        else:
-                            state.en_passant_target = pawn_cell.toUp()
-                
-        if self.is_half_move(move):
-            state.halfmove_clock += 1
-            if state.halfmove_clock == 75:
-                state.result = Result(ResultType.SEVENTYFIVE_MOVES)
+        self.key ^= en_passant_key(self.en_passant_target) ^ en_passant_key(new_en_passant_target)
+        self.en_passant_target = new_en_passant_target
+
+        if isHalfMove:
+            self.halfmove_clock += 1
         else:
-            state.halfmove_clock = 0        
-        if self.to_move == PieceColor.BLACK:
-            state.fullmove_number += 1
-    
-        return state
+            self.halfmove_clock = 0
+        if to_move == PieceColor.BLACK:
+            self.fullmove_number += 1
+
+        self.history = History(undo, self.check, self.history)
+
+    def unmake_move(self):
+
+        (
+            move, piece, captured, capturedCell, rookFromCell, rookToCell,
+            castling_rights,
+            en_passant_target, halfmove_clock, fullmove_number,
+            to_move, check, promo, result, moves, key
+        ) = self.history.undo
+        self.history = self.history.parent
+
+        if rookFromCell is not None:
+            rook = self.at(rookToCell)
+            self.set_piece(rookToCell, State.EMPTY_CELL)
+            self.set_piece(rookFromCell, rook)
+
+        if capturedCell is not None: # else a null move, nothing moved
+            # for a promo move toCell == fromCell, so the pawn is put back last
+            self.set_piece(CELLS[move >> 6 & 63], State.EMPTY_CELL)
+            self.set_piece(capturedCell, captured)
+            self.set_piece(CELLS[move & 63], piece)
+
+        self.castling_rights = list(castling_rights)
+        self.en_passant_target = en_passant_target
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.to_move = to_move
+        self.check = check
+        self.promo = promo
+        self._result = result
+        self._moves = moves
+        self.key = key
+
+    def make_null_move(self):
+        # the side to move passes, for null move pruning in the search. Not a
+        # legal move: not to be played in check or before a promotion choice.
+        # The halfmove clock starts over, no repetition goes across the pass.
+        # unmake_move takes it back.
+        undo = (
+            0, State.EMPTY_CELL, State.EMPTY_CELL, None, None, None,
+            tuple(self.castling_rights),
+            self.en_passant_target, self.halfmove_clock, self.fullmove_number,
+            self.to_move, self.check, self.promo, self._result, self._moves, self.key
+        )
+        self.key ^= BLACK_TO_MOVE_KEY ^ en_passant_key(self.en_passant_target) ^ en_passant_key(None)
+        self.to_move = opponent(self.to_move)
+        self.en_passant_target = None
+        self.halfmove_clock = 0
+        self._result = State.UNKNOWN_RESULT
+        self._moves = None
+        self.history = History(undo, None, self.history)
+
+    def has_pieces(self, color: PieceColor) -> bool:
+        # pieces other than pawns and the king, without them zugzwang is common
+        offset = 6 * color.value
+        return any(self.bitboards[offset + index] for index in (KNIGHTS, BISHOPS, ROOKS, QUEENS))
     # -----------------------------------------------
     # piece rule
     # def is_typ(self, piece: str):
     #     if piece.islower():    
     #         if str == ''
         
-    def possible_moves(self) -> list[Move]:
-        return self.possible_moves_color(self.to_move) 
-
-    def possible_moves_color(self, color:PieceColor, to_move_check = True):
-        moves =[]
-        for piece, curr_cell in self.piecemap.items():
-            curr_piece = parsePiece(piece)
-            if curr_piece.color == color:
-                for cell in curr_cell:
-                    moves += self.possible_piece_moves(curr_piece,cell, to_move_check)
-        return moves
-    
-    def to_direction (self, curr_cell:Cell, direc, distance) -> Cell:
-        if direc == 'toUp':
-            return curr_cell.toUp(distance)
-        elif direc == 'toDown':
-            return curr_cell.toDown(distance)
-        elif direc == 'toLeft':
-            return curr_cell.toLeft(distance)
-        elif direc == 'toRight':
-            return curr_cell.toRight(distance)
-        elif direc == 'toUpRight':
-            return curr_cell.toUpRight(distance)
-        elif direc == 'toUpLeft':
-            return curr_cell.toUpLeft(distance)
-        elif direc == 'toDownRight':
-            return curr_cell.toDownRight(distance)
-        elif direc == 'toDownLeft':
-            return curr_cell.toDownLeft(distance)
-        
-    def all_danger_zone_move(self, color:PieceColor):
-        moves =[]
-        for piece, curr_cell in self.piecemap.items():
-            curr_piece = parsePiece(piece)
-            if curr_piece.color == color:
-                for cell in curr_cell:
-                    moves += self.danger_zone_move(curr_piece,cell)
-        return moves
-
-    def danger_zone_move(self, piece:Piece, curr_cell:Cell):
-        moves = []
-        none = State.EMPTY_CELL
-
-        if self.result is not None: return moves
-        # WHITE PAWN
-        if piece == Piece(PieceType.PAWN, PieceColor.WHITE):
-            next_cell_capture = [curr_cell.toUpLeft(1), curr_cell.toUpRight(1)]
-            for next_cell in next_cell_capture:
-                if self.out_of_board(next_cell) is True: continue
-                if self.at(next_cell) != none:
-                    if self.at(next_cell).color != piece.color:
-                        moves.append(Move(curr_cell,next_cell))
-                        if next_cell == curr_cell.toUpLeft(1): moves.append(Move(curr_cell,next_cell.toUpLeft(1)))
-                        else: moves.append(Move(curr_cell,next_cell.toUpRight(1)))
-                    else:
-                        moves.append(Move(curr_cell,next_cell))
-
-                moves.append(Move(curr_cell,next_cell))
-
-        # BLACK PAWN
-        elif piece == Piece(PieceType.PAWN, PieceColor.BLACK):
-            next_cell_capture = [curr_cell.toDownLeft(1), curr_cell.toDownRight(1)]
-            for next_cell in next_cell_capture:
-                if self.out_of_board(next_cell) is True: continue
-                if self.at(next_cell) != none:
-                    # moves.append(Move(curr_cell,next_cell))
-                    if self.at(next_cell).color != piece.color:
-                        moves.append(Move(curr_cell,next_cell))
-                        if next_cell == curr_cell.toDownLeft(1): moves.append(Move(curr_cell,next_cell.toDownLeft(1)))
-                        else: moves.append(Move(curr_cell,next_cell.toDownRight(1)))
-                    else:
-                        moves.append(Move(curr_cell,next_cell))
-
-                moves.append(Move(curr_cell,next_cell))
-
-        elif piece.type == PieceType.KNIGHT: 
-            next_cells = [curr_cell.toUp(2).toRight(1), curr_cell.toUp(2).toLeft(1),
-                         curr_cell.toUp(1).toRight(2), curr_cell.toUp(1).toLeft(2),
-                         curr_cell.toDown(2).toRight(1), curr_cell.toDown(2).toLeft(1),
-                         curr_cell.toDown(1).toRight(2), curr_cell.toDown(1).toLeft(2)]
-            for next_cell in next_cells:
-
-                if self.out_of_board(next_cell) is True: continue
-
-                moves.append(Move(curr_cell,next_cell))
-
-        elif piece.type == PieceType.BISHOP:
-            directions = ['toUpRight', 'toUpLeft', 'toDownRight', 'toDownLeft']
-            for direct in directions:
-                for i in range(1,8):
-                    next_cell = self.to_direction(curr_cell, direct, i)
-                    if self.out_of_board(next_cell) is True: break 
-                    if self.at(next_cell) != none:
-                        if self.at(next_cell).color != piece.color:
-                            moves.append(Move(curr_cell,next_cell))
-                            moves.append(Move(curr_cell,self.to_direction(next_cell, direct, 1)))
-                            break
-                        else:
-                            moves.append(Move(curr_cell,next_cell))
-                            break
-
-                    moves.append(Move(curr_cell,next_cell))
-
-        elif piece.type == PieceType.ROOK:
-            directions = ['toUp', 'toDown', 'toLeft', 'toRight']
-            for direct in directions:
-                for i in range(1,8):
-                    next_cell = self.to_direction(curr_cell, direct, i) 
-                    if self.out_of_board(next_cell) is True: break
-                    if self.at(next_cell) != none:
-                        if self.at(next_cell).color != piece.color:
-                            moves.append(Move(curr_cell,next_cell))
-                            moves.append(Move(curr_cell,self.to_direction(next_cell, direct, 1)))
-                            break
-                        else:
-                            moves.append(Move(curr_cell,next_cell))
-                            break
-                    moves.append(Move(curr_cell,next_cell))
-                    
-        elif piece.type == PieceType.QUEEN:
-            directions = ['toUp', 'toDown', 'toLeft', 'toRight',
-                          'toUpRight', 'toUpLeft', 'toDownRight', 'toDownLeft']
-            for direct in directions:
-                for i in range(1,8):
-                    next_cell = self.to_direction(curr_cell, direct, i)
-                    if self.out_of_board(next_cell) is True: break
-                    if self.at(next_cell) != none:
-                        if self.at(next_cell).color != piece.color:
-                            moves.append(Move(curr_cell,next_cell))
-                            moves.append(Move(curr_cell,self.to_direction(next_cell, direct, 1)))
-                            break
-                        else:
-                            moves.append(Move(curr_cell,next_cell))
-                            break
-                    moves.append(Move(curr_cell,next_cell))
-        elif piece.type == PieceType.KING:
-            directions = ['toUp', 'toDown', 'toLeft', 'toRight',
-                        'toUpRight', 'toUpLeft', 'toDownRight', 'toDownLeft']
-            for direct in directions:
-                next_cell = self.to_direction(curr_cell, direct, 1)
-                if self.out_of_board(next_cell) is True: continue
-                if self.at(next_cell) != none:
-                    if self.at(next_cell).color != piece.color:
-                        moves.append(Move(curr_cell,next_cell))
-                        moves.append(Move(curr_cell,self.to_direction(next_cell, direct, 1)))
-
-                    else:
-                        moves.append(Move(curr_cell,next_cell))
-
-                moves.append(Move(curr_cell,next_cell))
-
-        return moves
-
-    
-    def possible_piece_moves(self, piece:Piece, curr_cell:Cell, to_move_check = True) -> list[Move]:
-        piece_color = piece.color
-        moves = []
-        none = State.EMPTY_CELL
-        # print(moves)
-        # if piece.color != self.to_move: raise Exception('Not your turn!!!')
-        if self.result is not None: return moves
-        # print(str(curr_cell) + ' ' + str(self.promo))
-        if self.promo == True and piece.type != PieceType.PAWN and piece.color == self.to_move: return moves
-        elif self.promo == True and piece.type == PieceType.PAWN and piece.color == self.to_move:
-            if curr_cell.row != 7 and curr_cell.row != 0: return moves 
-
-        # WHITE PAWN
-        if piece == Piece(PieceType.PAWN, PieceColor.WHITE):
-            if curr_cell.row == 0:
-                curr_cell_str = str(curr_cell)
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'Q'))
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'N'))
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'B'))
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'R'))
-            if self.out_of_board(curr_cell.toUp()): return moves
-            if self.at(curr_cell.toUp()) == none:
-                moves.append(Move(curr_cell,curr_cell.toUp()))
+    def possible_moves(self, packed=False) -> list[Move]:
+        # no moves once the game is over, rule draws included
+        if self.result is not None: return array("H") if packed else []
+        return self.legal_moves(packed)
+    
+    def legal_moves(self, packed=False) -> list[Move]:
+        # generated once per position as packed moves and shared by every
+        # caller (result, search, players), so the array must not be modified
+        if self._moves is None:
+            self._moves = self.possible_moves_color(self.to_move, packed=True)
+        if packed: return self._moves
+        return [Move.fromCode(code) for code in self._moves]
+
+    def legal_captures(self, packed=False) -> list[Move]:
+        # captures and promotions of the side to move, not cached: the
+        # quiescence search asks once per position
+        moves = self.possible_moves_color(self.to_move, packed=True, captures_only=True)
+        if packed: return moves
+        return [Move.fromCode(code) for code in moves]
+
+    def possible_moves_color(self, color:PieceColor, to_move_check = True, packed = False, captures_only = False):
+        # Checkers and pinned pieces are found once, then the targets of every
+        # piece are filtered with masks instead of playing each move out.
+        # Without to_move_check the pseudo-legal moves are returned.
+        # Moves are generated as 16-bit codes (see move.py), packed=True
+        # returns them as they are in an array('H').
+        # captures_only keeps the captures (en passant included) and the
+        # pawn moves to the last row, the moves of the quiescence search.
+        moves = array("H")
+        
+        pawn = Piece(PieceType.PAWN, color)
+        pawns = self.bitboards[piece_index(pawn)]
+        
+        if self.promo and color == self.to_move:
+            # only the pawn on the last row can move: it picks its promotion
+            for index in squares(pawns & ROWS[0 if color == PieceColor.WHITE else 7]):
+                moves.extend(index | index << 6 | promotion.value << 12 for promotion in PROMOTION_TYPES)
+            return moves if packed else [Move.fromCode(code) for code in moves]
+        
+        own = self.occupancy[color.value]
+        enemy = self.occupancy[1 - color.value]
+        occupied = own | enemy
+        target_mask = enemy if captures_only else ~own
+        kings = self.bitboards[piece_index(Piece(PieceType.KING, color))]
+        king = lsb(kings)
+        
+        check_mask = FULL
+        pins = {}
+        if to_move_check and king >= 0:
+            checkers = self.checkers(color)
+            if popcount(checkers) > 1:
+                check_mask = 0 # double check: only the king can move
+            elif checkers:
+                check_mask = checkers | BETWEEN[king][lsb(checkers)]
+            pins = self.pins(color)
+        
+        # pawns
+        forward = -8 if color == PieceColor.WHITE else 8
+        double_row = ROWS[6 if color == PieceColor.WHITE else 1]
+        pawn_attacks = PAWN_ATTACKS[color.value]
+        en_passant = self.en_passant_target
+        for index in squares(pawns):
+            targets = pawn_attacks[index] & enemy
+            push = index + forward
+            if 0 <= push < 64 and not occupied >> push & 1 and not (captures_only and 8 <= push < 56):
+                targets |= 1 << push
+                if not captures_only and double_row >> index & 1 and not occupied >> (push + forward) & 1:
+                    targets |= 1 << (push + forward)
+            self.add_moves(moves, index, targets & check_mask & pins.get(index, FULL))
             
-            if curr_cell.row == 6:
-                if self.at(curr_cell.toUp(2)) == none:
-                    moves.append(Move(curr_cell,curr_cell.toUp(2)))
-            next_cell_capture = [curr_cell.toUpLeft(1), curr_cell.toUpRight(1)]
-            for next_cell in next_cell_capture:
-                if self.out_of_board(next_cell) is True: continue
-
-                if self.at(next_cell) != none:
-                    if self.at(next_cell).color == piece_color: 
-                        continue
-                    moves.append(Move(curr_cell,next_cell))
+            if (
+                en_passant is not None and
+                pawn_attacks[index] >> en_passant.index & 1 and
+                not occupied >> en_passant.index & 1 and
+                (not to_move_check or self.is_legal_en_passant(index, en_passant.index, color))
+            ):
+                moves.append(index | en_passant.index << 6)
+        
+        # knights, bishops, rooks, queens
+        for piece_type in [PieceType.KNIGHT, PieceType.BISHOP, PieceType.ROOK, PieceType.QUEEN]:
+            for index in squares(self.bitboards[piece_index(Piece(piece_type, color))]):
+                if piece_type == PieceType.KNIGHT:
+                    targets = KNIGHT_ATTACKS[index]
+                elif piece_type == PieceType.BISHOP:
+                    targets = bishop_attacks(index, occupied)
+                elif piece_type == PieceType.ROOK:
+                    targets = rook_attacks(index, occupied)
                 else:
-                    if self.en_passant_target is not None and self.en_passant_target == next_cell:
-                        moves.append(Move(curr_cell,next_cell))
-        # BLACK PAWN
-        elif piece == Piece(PieceType.PAWN, PieceColor.BLACK):
-            if curr_cell.row == 7:
-                curr_cell_str = str(curr_cell)
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'q'))
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'n'))
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'b'))
-                moves.append(parseMove(curr_cell_str+curr_cell_str+'r'))    
-            if self.out_of_board(curr_cell.toDown()): return moves
-            if self.at(curr_cell.toDown()) == none:
-                moves.append(Move(curr_cell,curr_cell.toDown()))
-            if curr_cell.row == 1:
-                if self.at(curr_cell.toDown(2)) == none:
-                    moves.append(Move(curr_cell,curr_cell.toDown(2)))
-            next_cell_capture = [curr_cell.toDownLeft(1), curr_cell.toDownRight(1)]
-            for next_cell in next_cell_capture:
-                if self.out_of_board(next_cell) is True: continue
-                if self.at(next_cell) != none:
-                    if self.at(next_cell).color == piece_color: 
+                    targets = queen_attacks(index, occupied)
+                self.add_moves(moves, index, targets & target_mask & check_mask & pins.get(index, FULL))
+        
+        # king
+        for index in squares(kings):
+            targets = KING_ATTACKS[index] & target_mask
+            if to_move_check:
+                # the king does not block the squares behind it
+                for target in squares(targets):
+                    if self.is_square_attacked(Cell.fromIndex(target), opponent(color), occupied ^ 1 << index):
+                        targets ^= 1 << target
+            self.add_moves(moves, index, targets)
+            
+            # castling
+            if captures_only or index != (60 if color == PieceColor.WHITE else 4): continue
+            rights = self.castling_rights[0:2] if color == PieceColor.WHITE else self.castling_rights[2:4]
+            rook = Piece(PieceType.ROOK, color)
+            for right, rook_index, step in zip(rights, [index + 3, index - 4], [1, -1]):
+                if not right or self.board[rook_index >> 3][rook_index & 7] != rook: continue
+                if occupied & BETWEEN[index][rook_index]: continue
+                if to_move_check and any(
+                    self.is_square_attacked(Cell.fromIndex(index + step * i), opponent(color), occupied)
+                    for i in range(3)
+                ): continue
+                moves.append(index | (index + 2 * step) << 6)
+        
+        return moves if packed else [Move.fromCode(code) for code in moves]
+    
+    def add_moves(self, moves: array, fromIndex: int, targets: int):
+        for index in squares(targets):
+            moves.append(fromIndex | index << 6)
+    
+    # Attack tests look outward from the square instead of generating the enemy
+    # moves: a piece attacks the square iff the same piece standing on the
+    # square would attack it (pawns use the other color's table).
+    def attackers_to(self, square: Cell, occupied: int = None) -> int:
+        # pieces of both colors attacking square, occupied being the blockers
+        if occupied is None: occupied = self.occupied()
+        index = square.index
+        bb = self.bitboards
+        return (
+            (PAWN_ATTACKS[1][index] & bb[PAWNS]) |
+            (PAWN_ATTACKS[0][index] & bb[6 + PAWNS]) |
+            (KNIGHT_ATTACKS[index] & (bb[KNIGHTS] | bb[6 + KNIGHTS])) |
+            (KING_ATTACKS[index] & (bb[KINGS] | bb[6 + KINGS])) |
+            (bishop_attacks(index, occupied) & (bb[BISHOPS] | bb[QUEENS] | bb[6 + BISHOPS] | bb[6 + QUEENS])) |
+            (rook_attacks(index, occupied) & (bb[ROOKS] | bb[QUEENS] | bb[6 + ROOKS] | bb[6 + QUEENS]))
+        )
+    
+    def is_square_attacked(self, square: Cell, by_color: PieceColor, occupied: int = None) -> bool:
+        if occupied is None: occupied = self.occupied()
+        index = square.index
+        bb = self.bitboards
+        base = 6 * by_color.value
+        if KNIGHT_ATTACKS[index] & bb[base + KNIGHTS]: return True
+        if PAWN_ATTACKS[1 - by_color.value][index] & bb[base + PAWNS]: return True
+        if KING_ATTACKS[index] & bb[base + KINGS]: return True
+        queens = bb[base + QUEENS]
+        if bishop_attacks(index, occupied) & (bb[base + BISHOPS] | queens): return True
+        return rook_attacks(index, occupied) & (bb[base + ROOKS] | queens) != 0
+    
+    def king_cell(self, color: PieceColor) -> Cell:
+        king = lsb(self.bitboards[6 * color.value + KINGS])
+        return None if king < 0 else Cell.fromIndex(king)
+    
+    def checkers(self, color: PieceColor) -> int:
+        # enemy pieces giving check to the king of color
+        king = self.king_cell(color)
+        if king is None: return 0
+        return self.attackers_to(king) & self.occupancy[1 - color.value]
+    
+    def pins(self, color: PieceColor) -> dict[int, int]:
+        # pinned pieces of color, mapped to the squares they can still move to
+        king = lsb(self.bitboards[piece_index(Piece(PieceType.KING, color))])
+        own = self.occupancy[color.value]
+        occupied = self.occupied()
+        enemy = opponent(color)
+        queens = self.bitboards[piece_index(Piece(PieceType.QUEEN, enemy))]
+        
+        pins = {}
+        for directions, slider in [
+            (DIAGONAL_DIRECTIONS, Piece(PieceType.BISHOP, enemy)),
+            (ORTHOGONAL_DIRECTIONS, Piece(PieceType.ROOK, enemy))
+        ]:
+            sliders = self.bitboards[piece_index(slider)] | queens
+            for direction in directions:
+                pinned = -1
+                for index in RAYS[direction][king]:
+                    if not occupied >> index & 1: continue
+                    if pinned < 0 and own >> index & 1:
+                        pinned = index
                         continue
-                    moves.append(Move(curr_cell,next_cell))
-                else:
-                    if self.en_passant_target is not None and self.en_passant_target == next_cell:
-                        moves.append(Move(curr_cell,next_cell))
-
-        elif piece.type == PieceType.KNIGHT: 
-            next_cells = [curr_cell.toUp(2).toRight(1), curr_cell.toUp(2).toLeft(1),
-                         curr_cell.toUp(1).toRight(2), curr_cell.toUp(1).toLeft(2),
-                         curr_cell.toDown(2).toRight(1), curr_cell.toDown(2).toLeft(1),
-                         curr_cell.toDown(1).toRight(2), curr_cell.toDown(1).toLeft(2)]
-            for next_cell in next_cells:
-
-                if self.out_of_board(next_cell) is True: continue
-                if self.at(next_cell) != none:
-                    if self.at(next_cell).color == piece_color: continue
-                
-                moves.append(Move(curr_cell,next_cell))
-
-        elif piece.type == PieceType.BISHOP:
-            directions = ['toUpRight', 'toUpLeft', 'toDownRight', 'toDownLeft']
-            for direct in directions:
-                for i in range(1,8):
-                    next_cell = self.to_direction(curr_cell, direct, i)
-                    if self.out_of_board(next_cell) is True: break
-                    if self.at(next_cell) != none:
-                        if self.at(next_cell).color == piece_color: break
-                        else:
-                            moves.append(Move(curr_cell,next_cell))
-                            break
-                    moves.append(Move(curr_cell,next_cell))
-
-        elif piece.type == PieceType.ROOK:
-            directions = ['toUp', 'toDown', 'toLeft', 'toRight']
-            for direct in directions:
-                for i in range(1,8):
-                    next_cell = self.to_direction(curr_cell, direct, i) 
-                    if self.out_of_board(next_cell) is True: break
-                    if self.at(next_cell) != none:
-                        if self.at(next_cell).color == piece_color: break
-                        else:
-                            moves.append(Move(curr_cell,next_cell))
-                            break
-                    moves.append(Move(curr_cell,next_cell))
-                    
-        elif piece.type == PieceType.QUEEN:
-            directions = ['toUp', 'toDown', 'toLeft', 'toRight',
-                          'toUpRight', 'toUpLeft', 'toDownRight', 'toDownLeft']
-            for direct in directions:
-                for i in range(1,8):
-                    next_cell = self.to_direction(curr_cell, direct, i)
-                    if self.out_of_board(next_cell) is True: break
-                    if self.at(next_cell) != none:
-                        if self.at(next_cell).color == piece_color: break
-                        else:
-                            moves.append(Move(curr_cell,next_cell))
-                            break
-                    moves.append(Move(curr_cell,next_cell))
-
-        elif piece.type == PieceType.KING:
-            directions = ['toUp', 'toDown', 'toLeft', 'toRight',
-                          'toUpRight', 'toUpLeft', 'toDownRight', 'toDownLeft']
-            for direct in directions:
-                next_cell = self.to_direction(curr_cell, direct, 1)
-                if self.out_of_board(next_cell) is True: continue
-                if self.at(next_cell) != none:
-                    if self.at(next_cell).color == piece_color: continue
-                
-                moves.append(Move(curr_cell,next_cell))
-            #Castling
-            if piece.color == PieceColor.WHITE:
-                if self.castling_rights[0] == True:
-                    next_cell = curr_cell.toRight(2)
-                    if Move(curr_cell,curr_cell.toRight()) in moves:
-                        if self.at(next_cell) == none:
-                            moves.append(Move(curr_cell,curr_cell.toRight(2)))
-                if self.castling_rights[1] == True:
-                    next_cell = curr_cell.toLeft(2)
-                    if Move(curr_cell,curr_cell.toLeft()) in moves:
-                        if self.at(next_cell) == none:
-                            moves.append(Move(curr_cell,curr_cell.toLeft(2)))
-            else:
-                if self.castling_rights[2] == True:
-                    next_cell = curr_cell.toRight(2)
-                    if Move(curr_cell,curr_cell.toRight()) in moves:
-                        if self.at(next_cell) == none:
-                            moves.append(Move(curr_cell,curr_cell.toRight(2)))
-                if self.castling_rights[3] == True:
-                    next_cell = curr_cell.toLeft(2)
-                    if Move(curr_cell,curr_cell.toLeft()) in moves:
-                        if self.at(next_cell) == none:
-                            moves.append(Move(curr_cell,curr_cell.toLeft(2)))
-
-        remove_move = []
-        # King must not kill itseft
-        # print(moves)
-        if to_move_check:
-            if piece.type == PieceType.KING:
-                for check_move in moves:
-                    enemy_moves = self.all_danger_zone_move(opponent(self.to_move))
-                    for enemy_move in enemy_moves:
-                        if check_move.toCell == enemy_move.toCell:
-                            remove_move.append(check_move)
-                            break
-            else:
-                for check_move in moves:
-                    check_state = self.move(check_move, False)
-                    check_state.to_move = opponent(self.to_move)
-                    enemy_moves = check_state.possible_moves_color(opponent(self.to_move),False)
-                    for enemy_move in enemy_moves:
-                        if check_state.is_capture_king(enemy_move):
-                            remove_move.append(check_move)
-                            break
-                
-        for i in remove_move:
-            moves.remove(i)
-
-        return moves
+                    if pinned >= 0 and sliders >> index & 1:
+                        pins[pinned] = BETWEEN[king][index] | 1 << index
+                    break
+        return pins
+    
+    def is_legal_en_passant(self, fromIndex: int, toIndex: int, color: PieceColor) -> bool:
+        # both pawns leave their row at once, so just look at the king after the capture
+        king = lsb(self.bitboards[piece_index(Piece(PieceType.KING, color))])
+        if king < 0: return True
+        captured = 1 << (toIndex + 8 if color == PieceColor.WHITE else toIndex - 8)
+        occupied = (self.occupied() ^ 1 << fromIndex ^ captured) | 1 << toIndex
+        return not self.attackers_to(Cell.fromIndex(king), occupied) & self.occupancy[1 - color.value] & ~captured
+    
+    def see(self, move) -> int:
+        # static exchange evaluation: the material won by move (a Move or its
+        # code) when both sides then take on its square with their least
+        # valuable attacker, each side stopping when taking would lose.
+        # Pins and checks are not looked at.
+        code = move.code if isinstance(move, Move) else move
+        fromIndex = code & 63
+        toIndex = code >> 6 & 63
+        board = self.board
+        bb = self.bitboards
+        piece = board[fromIndex >> 3][fromIndex & 7]
+        victim = board[toIndex >> 3][toIndex & 7]
+        occupied = self.occupied() ^ 1 << fromIndex
+        gain = [SEE_VALUES[victim.type.value]]
+        value = SEE_VALUES[piece.type.value] # of the piece standing on the square
+        if piece.type == PieceType.PAWN:
+            if victim is State.EMPTY_CELL and (fromIndex - toIndex) & 7:
+                # en passant
+                gain[0] = SEE_VALUES[PieceType.PAWN.value]
+                occupied ^= 1 << (fromIndex & ~7 | toIndex & 7)
+            if toIndex >> 3 in (0, 7):
+                gain[0] += SEE_VALUES[PieceType.QUEEN.value] - SEE_VALUES[PieceType.PAWN.value]
+                value = SEE_VALUES[PieceType.QUEEN.value]
+        square = CELLS[toIndex]
+        color = opponent(piece.color)
+        while True:
+            attackers = self.attackers_to(square, occupied) & occupied
+            own = attackers & self.occupancy[color.value]
+            if not own: break
+            base = 6 * color.value
+            for index in (PAWNS, KNIGHTS, BISHOPS, ROOKS, QUEENS, KINGS):
+                if own & bb[base + index]: break
+            if index == KINGS and attackers & ~own:
+                break # the king cannot take a defended piece
+            gain.append(value - gain[-1])
+            value = SEE_VALUES[index + 1]
+            occupied ^= 1 << lsb(own & bb[base + index]) # sliders behind it now attack
+            color = opponent(color)
+        # each side takes only if it gains by it, from the last capture back
+        while len(gain) > 1:
+            last = gain.pop()
+            gain[-1] = -max(-gain[-1], last)
+        return gain[0]
 
+    def possible_piece_moves(self, piece:Piece, curr_cell:Cell, to_move_check = True) -> list[Move]:
+        if to_move_check and piece.color == self.to_move:
+            moves = self.legal_moves(packed=True)
+        else:
+            moves = self.possible_moves_color(piece.color, to_move_check, packed=True)
+        return [Move.fromCode(code) for code in moves if code & 63 == curr_cell.index]
 
-    
     # -----------------------------------------------
     # check cell
     def is_empty_cell(self, cell: Cell):
@@ -666,11 +607,12 @@ class State:
         return False
     
     def is_check(self, move: Move) -> bool:
-        typ = self.at(move.fromCell)
-        next_moves = self.possible_piece_moves(typ, move.toCell)
-        for next_move in next_moves:
-            if self.is_capture_king(next_move): return True
-        return False
+        # does the move attack the opponent king
+        self.make_move(move, False)
+        king = self.king_cell(opponent(self.to_move))
+        isCheck = king is not None and self.is_square_attacked(king, self.to_move)
+        self.unmake_move()
+        return isCheck
      
     def is_castling(self, move: Move):
         pass
@@ -766,7 +708,7 @@ class State:
     def is_checkmate(self):
         # enemy_color = opponent(self.to_move)
         if self.is_checking():
-            own_moves = self.possible_moves_color(self.to_move)
+            own_moves = self.legal_moves(packed=True)
             
             # print(own_moves)
             # for move in own_moves:
@@ -783,7 +725,7 @@ class State:
     def is_stalemate(self):
         # enemy_color = opponent(self.to_move)
         if not self.is_checking():
-            own_moves = self.possible_moves_color(self.to_move)
+            own_moves = self.legal_moves(packed=True)
             # for move in own_moves:
             #     check_state = self.move(move,False)
             #     enemy_moves = check_state.possible_moves_color(enemy_color)
@@ -798,19 +740,34 @@ class State:
         pass
     
     def is_75_moves(self):
-        pass
+        return self.halfmove_clock >= 75
     
     def is_50_moves(self):
         pass
     
     def is_fivefold_repetition(self):
-        pass
+        return self.repetitions() >= 5
     
     def is_threefold_repetition(self):
-        pass
+        return self.repetitions() >= 3
+    
+    def repetitions(self) -> int:
+        # times the current position occurred. Only the positions since the
+        # last capture or pawn move can be the same, every other ply back
+        # has the same side to move; undo records hold the key before each move.
+        count = 1
+        node = self.history
+        for ply in range(1, self.halfmove_clock + 1):
+            if node is None: break
+            if ply % 2 == 0 and node.undo[-1] == self.key:
+                count += 1
+            node = node.parent
+        return count
     
     def is_checking(self):
-        return self.check
+        # is the side to move in check
+        king = self.king_cell(self.to_move)
+        return king is not None and self.is_square_attacked(king, opponent(self.to_move))
     
     # -----------------------------------------------
     
@@ -827,10 +784,7 @@ class State:
         for row in range(State.BOARD_SIZE):
             for col in range(State.BOARD_SIZE):
                 fen_piece = fen_board[row*State.BOARD_SIZE + col]
-                self.board[row][col] = parsePiece(fen_piece)
-                
-                if fen_piece != ".":
-                    self.piecemap[fen_piece].append(Cell(row, col))
+                self.set_piece(Cell(row, col), parsePiece(fen_piece))
                 
         self.to_move = PieceColor.WHITE if fen_turn == "w" else PieceColor.BLACK
         
@@ -848,9 +802,23 @@ class State:
         
         self.halfmove_clock = int(fen_halfmove)
         self.fullmove_number = int(fen_fullmove)
-        # TODO: parse check state
+        
+        self.key = self.compute_key()
+        self.check = self.is_checking()
         # TODO: parse game over state
     
+    def compute_key(self) -> int:
+        
+        key = 0
+        for index, bb in enumerate(self.bitboards):
+            for square in squares(bb):
+                key ^= PIECE_KEYS[index][square]
+        
+        if self.to_move == PieceColor.BLACK:
+            key ^= BLACK_TO_MOVE_KEY
+        
+        return key ^ castling_key(self.castling_rights) ^ en_passant_key(self.en_passant_target)
+    
     def getFEN(self) -> str:
         
         fen_board = ""
@@ -911,6 +879,12 @@ class State:
         
         return board + "\n\nFEN: " + self.getFEN() + "\n"
     
+    def __hash__(self) -> int:
+        return self.key
+    
+    def __eq__(self, value: object) -> bool:
+        return isinstance(value, State) and self.key == value.key
+    
     
     
     
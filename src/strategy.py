@@ -1,57 +1,486 @@
 import math
+import time
 from src.game import Game
+from src.ordering import MoveOrdering, capture_gain, losing_capture
 from src.state import State
+from src.transposition import EXACT, LOWER, UPPER, TranspositionTable
 
-def cache1(function):
-    "Like lru_cache(None), but only considers the first argument of function."
-    cache = {}
-    def wrapped(x, *args):
-        if x not in cache:
-            cache[x] = function(x, *args)
-        return cache[x]
-    return wrapped
+# quiescence search: a capture is skipped when even winning its victim with
+# this much to spare (in evaluate_material units) does not reach alpha
+DELTA_MARGIN = 2
 
-def alpha_beta_cutoff_search(game: Game, state: State, d=4, cutoff_test=None, eval_fn=None):
+# iterative deepening searches d + 1 in a window of this much around the score
+# of d, and again with the failed side open when the score falls outside
+ASPIRATION_WINDOW = 1
+
+# pvs_search: the smallest difference between two scores of eval_fn, a zero
+# window search (alpha, alpha + NULL_WINDOW) only tells if a move beats alpha
+NULL_WINDOW = 1
+
+# pvs_search: plies taken off by null move pruning (R) and by late move
+# reductions, for quiet moves searched after the first LATE_MOVES of a position
+NULL_MOVE_REDUCTION = 2
+LATE_MOVE_REDUCTION = 1
+LATE_MOVES = 3
+
+# pvs_search near the horizon: a quiet move one ply from it is not searched
+# when the static score is this far below alpha (futility pruning), and up to
+# RAZOR_DRAFT plies from it only the quiescence search looks at a position
+# that far below alpha (razoring)
+FUTILITY_MARGIN = 1
+RAZOR_MARGIN = 3
+RAZOR_DRAFT = 2
+
+# a search given a stop event (threading.Event or alike) stops once it is set,
+# looking at it every STOP_INTERVAL nodes
+STOP_INTERVAL = 256
+
+class SearchTimeout(Exception):
+    """Raised when a search reaches its deadline or is stopped, the state is
+    back at the root."""
+
+def alpha_beta_cutoff_search(game: Game, state: State, d=4, cutoff_test=None, eval_fn=None, tt: TranspositionTable = None, deadline=None, stats=None, order_moves=True, ordering: MoveOrdering = None, quiescence=True, window=None, delta_margin=DELTA_MARGIN, root_moves=None, stop=None, alpha_bound=None):
     """Search game to determine best action; use alpha-beta pruning.
-    This version cuts off search and uses an evaluation function."""
+    This version cuts off search and uses an evaluation function.
+    Results are kept in tt (a new table when not given) by position key.
+    Moves are searched in the order of ordering (see ordering.py, a new one
+    when not given) unless order_moves is False.
+    With quiescence the positions past depth d are searched on with captures
+    and promotions only (see quiesce), so they are not evaluated in the
+    middle of an exchange. delta_margin is the margin of delta pruning (None
+    turns it off, then scores do not depend on the window).
+    window (alpha, beta) narrows the root search: a score outside of it is
+    only a bound. root_moves searches these root moves only, in this order.
+    alpha_bound() is a lower bound of the root score found elsewhere (by
+    another process), read every STOP_INTERVAL nodes: alpha is raised to it
+    as it improves, scores up to it are only bounds.
+    Past deadline (a time.monotonic() value) or once stop is set the search
+    raises SearchTimeout.
+    When given, the stats dict gets the node count and the score."""
 
     player = game.to_move(state)
+    tt = tt if tt is not None else TranspositionTable()
+    tt.new_search()
+    ordering = ordering if ordering is not None else MoveOrdering()
+    nodes = 0
+    floor = -math.inf # last alpha_bound() read
+
+    def visit():
+        nonlocal nodes, floor
+        nodes += 1
+        if deadline is not None and time.monotonic() >= deadline:
+            raise SearchTimeout()
+        if nodes % STOP_INTERVAL == 0:
+            if stop is not None and stop.is_set():
+                raise SearchTimeout()
+            if alpha_bound is not None:
+                floor = max(floor, alpha_bound())
+
+    # table scores are from the side to move, the search scores are from player
+    def probe(state: State, draft, alpha, beta):
+        # (score if it decides the node else None, best move of the entry)
+        entry = tt.probe(state.key)
+        if entry is None:
+            return None, None
+        if entry[1] < draft:
+            return None, entry[4]
+        score, bound = entry[2], entry[3]
+        if state.to_move != player:
+            score = -score
+            bound = EXACT if bound == EXACT else LOWER if bound == UPPER else UPPER
+        if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+            return score, entry[4]
+        return None, entry[4]
+
+    def actions(state: State, tt_move, depth):
+        if not order_moves:
+            return game.actions(state)
+        return ordering.order(state, game.actions(state), tt_move, depth)
+
+    def store(state: State, draft, v, alpha, beta, move):
+        bound = EXACT
+        if v <= alpha: bound = UPPER
+        elif v >= beta: bound = LOWER
+        if state.to_move != player:
+            v = -v
+            bound = EXACT if bound == EXACT else LOWER if bound == UPPER else UPPER
+        tt.store(state.key, draft, v, bound, move)
+
+    def quiesce(state: State, alpha, beta, depth):
+        # Past the depth only captures and promotions are played, until the
+        # position is quiet. The side to move can also stand pat: keep the
+        # static score instead of capturing, except when the pawn on the last
+        # row picks its piece, or in check right past the depth: then every
+        # evasion is searched (deeper down that would cost more than it finds).
+        visit()
+        maximizing = game.to_move(state) == player
+        stand = None
+        if state.promo:
+            moves = state.legal_moves(packed=True)
+        elif state.check and depth == d + 1:
+            moves = state.legal_moves(packed=True)
+            if not moves:
+                return eval_fn(state, player)
+        else:
+            stand = eval_fn(state, player)
+            if maximizing:
+                if stand >= beta: return stand
+                alpha = max(alpha, stand)
+            else:
+                if stand <= alpha: return stand
+                beta = min(beta, stand)
+            # losing captures are not searched
+            moves = [a for a in state.legal_captures(packed=True) if not losing_capture(state, a)]
+        v = stand if stand is not None else -math.inf if maximizing else math.inf
+        for a in ordering.order(state, moves, None, depth, see=False):
+            if stand is not None and delta_margin is not None:
+                # delta pruning
+                gain = capture_gain(state, a) + delta_margin
+                if (stand + gain <= alpha) if maximizing else (stand - gain >= beta):
+                    continue
+            state.make_move(a)
+            score = quiesce(state, alpha, beta, depth + 1)
+            state.unmake_move()
+            if maximizing:
+                v = max(v, score)
+                if v >= beta: return v
+                alpha = max(alpha, v)
+            else:
+                v = min(v, score)
+                if v <= alpha: return v
+                beta = min(beta, v)
+        return v
 
     # Functions used by alpha_beta
-    @cache1
+    # the state is searched in place with make_move/unmake_move, actions
+    # being packed moves (ints) the search does not allocate move objects
     def max_value(state: State, alpha, beta, depth):
+        if quiescence and depth > d:
+            return quiesce(state, alpha, beta, depth)
+        visit()
         if cutoff_test(state, depth):
             return eval_fn(state, player)
+        draft = d + 1 - depth
+        score, tt_move = probe(state, draft, alpha, beta)
+        if score is not None:
+            return score
         v = -math.inf
-        for a in game.actions(state):
-            v = max(v, min_value(game.result(state, a), alpha, beta, depth + 1))
+        best = None
+        alpha0 = alpha
+        for a in actions(state, tt_move, depth):
+            state.make_move(a)
+            score = value(state, alpha, beta, depth + 1)
+            state.unmake_move()
+            if score > v:
+                v = score
+                best = a
             if v >= beta:
-                return v
-            alpha = max(alpha, v)
+                ordering.cutoff(state, a, depth, draft)
+                break
+            # the floor only rises after a child, so it is above their alpha
+            alpha = max(alpha, v, floor)
+        store(state, draft, v, max(alpha0, floor), beta, best)
         return v
 
-    @cache1
     def min_value(state: State, alpha, beta, depth):
+        if quiescence and depth > d:
+            return quiesce(state, alpha, beta, depth)
+        visit()
         if cutoff_test(state, depth):
             return eval_fn(state, player)
+        draft = d + 1 - depth
+        score, tt_move = probe(state, draft, alpha, beta)
+        if score is not None:
+            return score
         v = math.inf
-        for a in game.actions(state):
-            v = min(v, max_value(game.result(state, a), alpha, beta, depth + 1))
+        best = None
+        beta0 = beta
+        for a in actions(state, tt_move, depth):
+            state.make_move(a)
+            score = value(state, alpha, beta, depth + 1)
+            state.unmake_move()
+            if score < v:
+                v = score
+                best = a
+            alpha = max(alpha, floor)
             if v <= alpha:
-                return v
+                ordering.cutoff(state, a, depth, draft)
+                break
             beta = min(beta, v)
+        store(state, draft, v, max(alpha, floor), beta0, best)
         return v
 
+    def value(state: State, alpha, beta, depth):
+        # the side to move decides, after a pawn reaches the last row it is
+        # still the same player choosing the promotion
+        if game.to_move(state) == player:
+            return max_value(state, alpha, beta, depth)
+        return min_value(state, alpha, beta, depth)
+
     # Body of alpha_beta_cutoff_search starts here:
     # The default test cuts off at depth d or at a terminal state
     cutoff_test = (cutoff_test or (lambda state, depth: depth > d or game.terminal_test(state)))
-    eval_fn = eval_fn or (lambda state: game.utility(state, player))
+    eval_fn = eval_fn or (lambda state, player: game.utility(state, player))
+    alpha, beta = window if window is not None else (-math.inf, math.inf)
     best_score = -math.inf
-    beta = math.inf
     best_action = None
-    for a in game.actions(state):
-        v = min_value(game.result(state, a), best_score, beta, 1)
-        if v > best_score:
-            best_score = v
-            best_action = a
-    return best_action
\ No newline at end of file
+    root = state.history
+    partial = root_moves is not None # then the root is not stored
+    try:
+        if not partial:
+            entry = tt.probe(state.key)
+            root_moves = actions(state, entry[4] if entry else None, 0)
+        for a in root_moves:
+            state.make_move(a)
+            v = value(state, max(alpha, best_score, floor), beta, 1)
+            state.unmake_move()
+            if v > best_score:
+                best_score = v
+                best_action = a
+            if best_score >= beta:
+                break
+    except SearchTimeout:
+        # unwind the moves still on the board
+        while state.history is not root:
+            state.unmake_move()
+        raise
+    finally:
+        if stats is not None:
+            stats["nodes"] = stats.get("nodes", 0) + nodes
+    if best_action is not None and not partial:
+        store(state, d + 1, best_score, max(alpha, floor), beta, best_action)
+    if stats is not None:
+        stats["score"] = best_score
+    return best_action
+
+def pvs_search(game: Game, state: State, d=4, eval_fn=None, tt: TranspositionTable = None, deadline=None, stats=None, order_moves=True, ordering: MoveOrdering = None, quiescence=True, window=None, null_move=NULL_MOVE_REDUCTION, late_move=LATE_MOVE_REDUCTION, pruning=True, stop=None):
+    """Principal variation search: alpha_beta_cutoff_search in negamax form,
+    taking the same arguments (but cutoff_test) and returning the same action
+    and stats.
+    Every position is searched from its side to move. Once a move is found,
+    the next ones are searched with a zero window, which only proves that they
+    are not better, and searched again with the full window when they are.
+    With good move ordering most moves are only proven worse.
+    null_move and late_move are the plies taken off by null move pruning and
+    late move reductions (0 turns them off), pruning turns on futility pruning
+    and razoring (with quiescence only)."""
+
+    tt = tt if tt is not None else TranspositionTable()
+    tt.new_search()
+    ordering = ordering if ordering is not None else MoveOrdering()
+    eval_fn = eval_fn or (lambda state, player: game.utility(state, player))
+    nodes = 0
+    best_action = None
+
+    def visit():
+        nonlocal nodes
+        nodes += 1
+        if deadline is not None and time.monotonic() >= deadline:
+            raise SearchTimeout()
+        if stop is not None and nodes % STOP_INTERVAL == 0 and stop.is_set():
+            raise SearchTimeout()
+
+    def actions(state: State, tt_move, ply):
+        if not order_moves:
+            return game.actions(state)
+        return ordering.order(state, game.actions(state), tt_move, ply)
+
+    def child(search, state: State, side, alpha, beta, *args):
+        # score for side of the position after its move, after a pawn reaches
+        # the last row it is still side choosing the promotion
+        if state.to_move == side:
+            return search(state, alpha, beta, *args)
+        return -search(state, -beta, -alpha, *args)
+
+    def quiesce(state: State, alpha, beta, ply, evasions):
+        # alpha_beta_cutoff_search's quiesce from the side to move
+        visit()
+        side = state.to_move
+        stand = None
+        if state.promo:
+            moves = state.legal_moves(packed=True)
+        elif state.check and evasions:
+            moves = state.legal_moves(packed=True)
+            if not moves:
+                return eval_fn(state, side)
+        else:
+            stand = eval_fn(state, side)
+            if stand >= beta: return stand
+            alpha = max(alpha, stand)
+            moves = [a for a in state.legal_captures(packed=True) if not losing_capture(state, a)]
+        v = stand if stand is not None else -math.inf
+        for a in ordering.order(state, moves, None, ply, see=False):
+            if stand is not None and stand + capture_gain(state, a) + DELTA_MARGIN <= alpha:
+                continue # delta pruning
+            state.make_move(a)
+            score = child(quiesce, state, side, alpha, beta, ply + 1, False)
+            state.unmake_move()
+            v = max(v, score)
+            if v >= beta: return v
+            alpha = max(alpha, v)
+        return v
+
+    def search(state: State, alpha, beta, ply, draft, null_ok=True):
+        # draft: plies left to the horizon, ply: plies from the root
+        nonlocal best_action
+        if draft <= 0:
+            if quiescence:
+                return quiesce(state, alpha, beta, ply, True)
+            visit()
+            return eval_fn(state, state.to_move)
+        if ply > 0:
+            visit()
+            if game.terminal_test(state):
+                return eval_fn(state, state.to_move)
+        side = state.to_move
+        entry = tt.probe(state.key)
+        tt_move = entry[4] if entry else None
+        if entry is not None and entry[1] >= draft and ply > 0:
+            score, bound = entry[2], entry[3]
+            if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                return score
+
+        quiet = ply > 0 and not state.check and not state.promo
+        static = eval_fn(state, side) if quiet else None
+        if pruning and quiescence and quiet and draft <= RAZOR_DRAFT and static + RAZOR_MARGIN <= alpha:
+            # razoring: only a capture could still reach alpha
+            score = quiesce(state, alpha, alpha + NULL_WINDOW, ply, True)
+            if score <= alpha:
+                return score
+        futile = pruning and quiescence and quiet and draft == 1 and static + FUTILITY_MARGIN <= alpha
+
+        if (
+            null_move and null_ok and quiet and draft > null_move + 1 and
+            state.has_pieces(side) and static >= beta
+        ):
+            # null move pruning: if passing still fails high the position is
+            # good enough, without zugzwang (pawn endings) a move would do better
+            state.make_null_move()
+            score = -search(state, -beta, -beta + NULL_WINDOW, ply + 1, draft - 1 - null_move, False)
+            state.unmake_move()
+            if score >= beta:
+                return score
+
+        v = -math.inf
+        best = None
+        alpha0 = alpha
+        for i, a in enumerate(actions(state, tt_move, ply)):
+            late = late_move and quiet and i >= LATE_MOVES and draft > late_move
+            quiet_move = (late or futile) and ordering.is_quiet(state, a)
+            late = late and quiet_move
+            state.make_move(a)
+            if futile and quiet_move and not state.check and not state.promo:
+                # futility pruning: its quiescence search would stand pat below alpha
+                state.unmake_move()
+                v = max(v, static + FUTILITY_MARGIN)
+                continue
+            if best is None:
+                score = child(search, state, side, alpha, beta, ply + 1, draft - 1)
+            else:
+                reduced = late and not state.check
+                if reduced:
+                    # late move reduction: searched less deep, and again at
+                    # full depth when it beats alpha anyway
+                    score = child(search, state, side, alpha, alpha + NULL_WINDOW, ply + 1, draft - 1 - late_move)
+                if not reduced or score > alpha:
+                    score = child(search, state, side, alpha, alpha + NULL_WINDOW, ply + 1, draft - 1)
+                if alpha < score < beta:
+                    score = child(search, state, side, alpha, beta, ply + 1, draft - 1)
+            state.unmake_move()
+            if score > v:
+                v = score
+                best = a
+            if v >= beta:
+                ordering.cutoff(state, a, ply, draft)
+                break
+            alpha = max(alpha, v)
+        if best is not None:
+            bound = UPPER if v <= alpha0 else LOWER if v >= beta else EXACT
+            tt.store(state.key, draft, v, bound, best)
+        if ply == 0:
+            best_action = best
+        return v
+
+    alpha, beta = window if window is not None else (-math.inf, math.inf)
+    root = state.history
+    try:
+        score = search(state, alpha, beta, 0, d + 1)
+    except SearchTimeout:
+        while state.history is not root:
+            state.unmake_move()
+        raise
+    finally:
+        if stats is not None:
+            stats["nodes"] = stats.get("nodes", 0) + nodes
+    if stats is not None:
+        stats["score"] = score
+    return best_action
+
+def iterative_deepening_search(game: Game, state: State, time_limit=None, deadline=None, max_depth=64, eval_fn=None, tt: TranspositionTable = None, stats=None, ordering: MoveOrdering = None, search=alpha_beta_cutoff_search, aspiration=ASPIRATION_WINDOW, min_depth=0, report=None, stop=None, **options):
+    """Run search (alpha_beta_cutoff_search or pvs_search) with d = min_depth,
+    min_depth + 1, ... until max_depth or until the time is up, and return the
+    best action of the last iteration that finished. Each iteration starts
+    from the table, killers and history of the previous one, and from a
+    window of aspiration around its score (None searches the full window).
+    The time is time_limit seconds from now or the deadline (time.monotonic()),
+    the search also ends once stop is set.
+    Other options are passed on to search.
+    When given, stats gets the nodes, the depth and the score of that iteration,
+    and the number of searches repeated because the score left the window.
+    report(stats, action) is called after every iteration."""
+
+    if deadline is None and time_limit is not None:
+        deadline = time.monotonic() + time_limit
+    tt = tt if tt is not None else TranspositionTable()
+    ordering = ordering if ordering is not None else MoveOrdering()
+    ordering.new_search()
+    stats = stats if stats is not None else {}
+    stats.setdefault("researches", 0)
+    actions = game.actions(state)
+    best_action = actions[0] if actions else None # played if not even d = 0 finishes
+    score = None
+    for d in range(min_depth, max_depth + 1):
+        if stop is not None and stop.is_set():
+            break
+        iteration = {}
+        window = None
+        if aspiration is not None and score is not None:
+            window = (score - aspiration, score + aspiration)
+        try:
+            while True:
+                action = search(game, state, d, eval_fn=eval_fn, tt=tt, deadline=deadline, stats=iteration, ordering=ordering, window=window, stop=stop, **options)
+                if window is None or window[0] < iteration["score"] < window[1]:
+                    break
+                # the score is only a bound, open the side it fell out of
+                stats["researches"] += 1
+                if iteration["score"] <= window[0]:
+                    window = (-math.inf, window[1])
+                else:
+                    window = (window[0], math.inf)
+        except SearchTimeout:
+            stats["nodes"] = stats.get("nodes", 0) + iteration.get("nodes", 0)
+            break
+        stats["nodes"] = stats.get("nodes", 0) + iteration["nodes"]
+        stats["depth"] = d
+        stats["score"] = score = iteration["score"]
+        best_action = action
+        if report is not None:
+            report(stats, action)
+        if len(actions) <= 1:
+            break # nothing to choose
+    return best_action
+
+def principal_variation(state: State, tt: TranspositionTable, max_length=64) -> list[int]:
+    """The moves the search expects from state: the best move of the table,
+    then the one of the position it leads to, ... while they are legal."""
+    position = state.copy()
+    pv = []
+    seen = set()
+    while len(pv) < max_length and position.result is None and position.key not in seen:
+        seen.add(position.key)
+        entry = tt.probe(position.key)
+        if entry is None or entry[4] not in position.legal_moves(packed=True):
+            break
+        pv.append(entry[4])
+        position.make_move(entry[4])
+    return pv
@@ -0,0 +1,216 @@
+# Transposition table: search results by position key (see zobrist.py) so a
+# position reached again, by another move order or in the next search, is not
+# searched again.
+#
+# The table is a fixed number of buckets of two slots: the first keeps the
+# deepest result (or the newest one once a new search started), the second
+# always takes the latest result, so recent shallow entries do not push deep
+# ones out.
+#
+# Scores are stored from the point of view of the side to move of the position
+# (see TranspositionTable.store), the search converts them to its own player.
+#
+# SharedTranspositionTable keeps the same buckets in shared memory for the
+# processes of a parallel search (see parallel.py).
+
+import os
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+
+EXACT = 0 # score is the value of the position
+LOWER = 1 # value >= score (the search failed high)
+UPPER = 2 # value <= score (the search failed low)
+
+# entries are tuples (key, depth, score, bound, move, age), about this many
+# bytes each in CPython with the list slot pointing to it
+ENTRY_BYTES = 128
+
+class TranspositionTable:
+
+    def __init__(self, size_mb: float = 16) -> None:
+        buckets = 1
+        while buckets * 4 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+            buckets *= 2 # power of two, the bucket is key & mask
+        self.mask = buckets - 1
+        self.entries = [None] * (2 * buckets)
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0 # stores replacing the entry of another position
+
+    def new_search(self):
+        # entries of older searches can be replaced whatever their depth
+        self.age += 1
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+        self.age = self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def probe(self, key: int):
+        index = 2 * (key & self.mask)
+        entries = self.entries
+        for entry in (entries[index], entries[index + 1]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, score, bound: int, move: int = None):
+        index = 2 * (key & self.mask)
+        entries = self.entries
+        deepest = entries[index]
+        if (
+            deepest is None or deepest[0] == key or
+            deepest[5] != self.age or depth >= deepest[1]
+        ):
+            old = deepest
+        else:
+            index += 1
+            old = entries[index]
+        if move is None and old is not None and old[0] == key:
+            move = old[4] # keep the best move of an earlier search
+        if old is not None and old[0] != key:
+            self.overwrites += 1
+        entries[index] = (key, depth, score, bound, move, self.age)
+        self.stores += 1
+
+    def size(self) -> int:
+        return len(self.entries)
+
+    def usage(self) -> float:
+        return sum(entry is not None for entry in self.entries) / len(self.entries)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "overwrites": self.overwrites
+        }
+
+    def __repr__(self) -> str:
+        return f"<TranspositionTable {self.size()} entries, {self.stats()}>"
+
+# SharedTranspositionTable entries: two 64-bit words, key ^ data and data,
+# data being
+#
+#   bits  0-15  move (packed, 0 for none)
+#   bits 16-31  score + SCORE_OFFSET
+#   bits 32-39  depth
+#   bits 40-41  bound
+#   bits 42-47  age
+#
+# Processes read and write without locks: a slot written by two processes at
+# once holds words of both, then key ^ data no longer gives the key and the
+# entry is ignored.
+SHARED_ENTRY_BYTES = 16
+SCORE_OFFSET = 1 << 15
+
+class SharedTranspositionTable(TranspositionTable):
+    """TranspositionTable in shared memory. Created with size_mb by one process,
+    opened with the name of its memory by the others (pickling it does that).
+    Only integer scores within 16 bits are stored."""
+
+    def __init__(self, size_mb: float = 16, name: str = None) -> None:
+        if name is None:
+            buckets = 1
+            while buckets * 4 * SHARED_ENTRY_BYTES <= size_mb * 1024 * 1024:
+                buckets *= 2
+            # one more word for the age, set by the process that created it
+            self.memory = SharedMemory(create=True, size=(4 * buckets + 1) * 8)
+            self.memory.buf[:] = bytes(self.memory.size)
+            self.owner = os.getpid()
+        else:
+            self.memory = SharedMemory(name=name)
+            self.owner = None
+        self.words = self.memory.buf.cast("Q")
+        self._finalizer = weakref.finalize(
+            self, SharedTranspositionTable._release, self.words, self.memory, self.owner is not None
+        )
+        self.mask = (len(self.words) - 1) // 4 - 1
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @staticmethod
+    def _release(words: memoryview, memory: SharedMemory, unlink: bool):
+        words.release()
+        memory.close()
+        if unlink:
+            memory.unlink()
+
+    def close(self):
+        # the memory is freed once the creating process closed it
+        self._finalizer()
+
+    def __reduce__(self):
+        return (SharedTranspositionTable, (0, self.memory.name))
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def age(self) -> int:
+        return self.words[-1]
+
+    def new_search(self):
+        # the searches of the other processes are part of the same search
+        if self.owner == os.getpid():
+            self.words[-1] = (self.words[-1] + 1) & 63
+
+    def clear(self):
+        self.memory.buf[:] = bytes(self.memory.size)
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def read(self, slot: int):
+        words = self.words
+        data = words[2 * slot + 1]
+        if not data: return None
+        return (
+            words[2 * slot] ^ data, data >> 32 & 255, (data >> 16 & 0xFFFF) - SCORE_OFFSET,
+            data >> 40 & 3, (data & 0xFFFF) or None, data >> 42 & 63
+        )
+
+    def probe(self, key: int):
+        slot = 2 * (key & self.mask)
+        for entry in (self.read(slot), self.read(slot + 1)):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, score, bound: int, move: int = None):
+        if not -SCORE_OFFSET <= score < SCORE_OFFSET or score != int(score):
+            return
+        slot = 2 * (key & self.mask)
+        age = self.age
+        deepest = self.read(slot)
+        if not (
+            deepest is None or deepest[0] == key or
+            deepest[5] != age or depth >= deepest[1]
+        ):
+            slot += 1
+        old = self.read(slot)
+        if move is None and old is not None and old[0] == key:
+            move = old[4]
+        if old is not None and old[0] != key:
+            self.overwrites += 1
+        data = (move or 0) | (int(score) + SCORE_OFFSET) << 16 | min(depth, 255) << 32 | bound << 40 | age << 42
+        self.words[2 * slot] = key ^ data
+        self.words[2 * slot + 1] = data
+        self.stores += 1
+
+    def size(self) -> int:
+        return (len(self.words) - 1) // 2
+
+    def usage(self) -> float:
+        words = self.words
+        return sum(words[i] != 0 for i in range(1, len(words) - 1, 2)) / self.size()
+
+    def __repr__(self) -> str:
+        return f"<SharedTranspositionTable {self.name} {self.size()} entries, {self.stats()}>"
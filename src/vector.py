@@ -1,4 +1,5 @@
 class Vector:    
+    __slots__ = ("rowax", "colax")
     
     def __init__(self, rowax: int, colax: int) -> None:
         self.rowax = rowax
@@ -6,6 +7,9 @@ class Vector:
         
     def __eq__(self, value: object) -> bool:
         return self.rowax == value.rowax and self.colax == value.colax
+    
+    def __hash__(self) -> int:
+        return hash((self.rowax, self.colax))
         
     @staticmethod
     def up(weight = 1):
@@ -0,0 +1,26 @@
+import random
+from src.bitboard import PIECES
+
+# Zobrist hashing: a position key is the xor of one random 64-bit number per
+# feature (piece on a square, side to move, castling right, en passant file),
+# so a move updates it with a few xors. The seed is fixed to get the same keys
+# in every process.
+
+rng = random.Random(20240501)
+
+PIECE_KEYS = [[rng.getrandbits(64) for _ in range(64)] for _ in PIECES]
+BLACK_TO_MOVE_KEY = rng.getrandbits(64)
+CASTLING_KEYS = [rng.getrandbits(64) for _ in range(4)] # KQkq
+EN_PASSANT_KEYS = [rng.getrandbits(64) for _ in range(8)] # by file
+
+def castling_key(castling_rights) -> int:
+    key = 0
+    for i, right in enumerate(castling_rights):
+        if right:
+            key ^= CASTLING_KEYS[i]
+    return key
+
+def en_passant_key(en_passant_target) -> int:
+    if en_passant_target is None:
+        return 0
+    return EN_PASSANT_KEYS[en_passant_target.col]